@@ -3,9 +3,7 @@ import fastapi
 from fastapi.middleware.cors import CORSMiddleware
 from routes.blockchain_route import router as blockchain_router
 import asyncio
-import aiohttp
 import os
-import requests
 import httpx
 
 from dotenv import load_dotenv  # Added
@@ -31,11 +29,9 @@ async def cache_request_body(request: fastapi.Request, call_next):
     # Read the body and cache it in request.state.body
     request.state.body = await request.body()
 
-    # Reset the body stream so that it can be read again
-    async def receive():
-        return {"type": "http.request", "body": request.state.body}
-
-    request._receive = receive
+    # BaseHTTPMiddleware replays the body read above to the route, so the receive
+    # channel is left alone; replacing it breaks disconnect detection for streaming
+    # responses.
     response = await call_next(request)
     return response
 
@@ -55,9 +51,9 @@ async def periodic_replace_chain():
     while True:
         await asyncio.sleep(60)  # Execute every 60 seconds
         try:
-            from routes.blockchain_route import blockchain
+            from routes.blockchain_route import blockchain, p2p_client
 
-            replaced = blockchain.replace_chain()
+            replaced = await blockchain.replace_chain(p2p_client)
             if replaced:
                 print("Chain was replaced with the longest one.")
             else:
@@ -66,35 +62,24 @@ async def periodic_replace_chain():
             print(f"Error during replace_chain: {e}")
 
 
-# Background task for mining blocks periodically
-async def periodic_mine_block():
-    await asyncio.sleep(60)  # 초기 지연 시간
-    while True:
-        try:
-            data = {"miner_address": "main server"}
-
-            # 일반 HTTP POST 요청
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "http://localhost:8000/api/mine_block", json=data
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        print("자동 블록 채굴 성공:", result)
-                    else:
-                        print(
-                            f"자동 블록 채굴 실패: {response.status}, {await response.text()}"
-                        )
-        except Exception as e:
-            print(f"자동 블록 채굴 중 오류 발생: {e}")
+@app.on_event("shutdown")
+async def shutdown_event():
+    from routes.blockchain_route import blockchain, mining_scheduler, p2p_client, tx_relay
 
-        await asyncio.sleep(60)  # 다음 실행까지 대기 시간
+    await mining_scheduler.stop()
+    await tx_relay.close()  # Send transactions still queued for peers
+    await p2p_client.close()
+    # Flush batched mempool admissions so acknowledged transactions are not lost
+    blockchain.close()
 
 
 @app.on_event("startup")
 async def startup_event():
+    from routes.blockchain_route import blockchain, mining_scheduler, p2p_client
+
+    p2p_client.start()
     asyncio.create_task(periodic_replace_chain())
-    asyncio.create_task(periodic_mine_block())
+    mining_scheduler.start()
 
     # Automatic node registration if not the bootstrap node
     host = os.getenv("HOST", "localhost")
@@ -107,37 +92,26 @@ async def startup_event():
 
     if node_address != bootstrap_node:
         try:
-            # Register with the bootstrap node
+            # Register with the bootstrap node, which gossips our address to the network
             print(f"Registering with bootstrap node at {bootstrap_node}")
-            response = requests.post(
-                f"{bootstrap_node}/api/register_node",
-                json={"node_address": node_address},
+            response = await p2p_client.post_json(
+                bootstrap_node, "/api/register_node", {"node_address": node_address}
             )
             if response.status_code == 200:
                 print("Successfully registered with the bootstrap node.")
             else:
                 print(f"Failed to register with bootstrap node: {response.text}")
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error registering with bootstrap node: {e}")
 
         try:
             # Retrieve the list of nodes from the bootstrap node
             print(f"Retrieving node list from bootstrap node at {bootstrap_node}")
-            response = requests.get(f"{bootstrap_node}/api/get_nodes")
-            if response.status_code == 200:
-                nodes = response.json()
-                print(f"Discovered nodes: {nodes}")
-                for node in nodes:
-                    if node != node_address:
-                        try:
-                            print(f"Registering with node: {node}")
-                            requests.post(
-                                f"{node}/api/register_node",
-                                json={"node_address": node_address},
-                            )
-                        except requests.exceptions.RequestException as e:
-                            print(f"Failed to register with node {node}: {e}")
-            else:
-                print(f"Failed to retrieve node list: {response.text}")
-        except requests.exceptions.RequestException as e:
+            nodes = await p2p_client.get_json(bootstrap_node, "/api/get_nodes")
+            print(f"Discovered nodes: {nodes}")
+            # Peers to gossip with
+            for node in [bootstrap_node, *nodes]:
+                if node != node_address:
+                    blockchain.register_node(node)
+        except (httpx.HTTPError, ValueError) as e:
             print(f"Error retrieving node list: {e}")
@@ -0,0 +1,147 @@
+# block_log.py
+import json as _json
+import os as _os
+import struct as _struct
+import zlib as _zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Every record is stored as <payload length:uint32><crc32:uint32><json payload>.
+# A crash can only ever leave a partially written frame at the end of the file,
+# which is detected by a short read or a checksum mismatch and truncated away.
+FRAME_HEADER = _struct.Struct("<II")
+
+
+def encode_frame(record: dict) -> bytes:
+    """
+    Serialize a record into a length-prefixed, checksummed frame.
+    """
+    payload = _json.dumps(record, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(len(payload), _zlib.crc32(payload)) + payload
+
+
+def decode_frame(buffer, offset: int) -> Tuple[Optional[dict], int]:
+    """
+    Decode the frame starting at `offset`.
+    Returns (record, next_offset), or (None, offset) if the frame is torn or corrupt.
+    """
+    header_end = offset + FRAME_HEADER.size
+    if header_end > len(buffer):
+        return None, offset
+    length, checksum = FRAME_HEADER.unpack_from(buffer, offset)
+    payload_end = header_end + length
+    if payload_end > len(buffer):
+        return None, offset
+    payload = bytes(buffer[header_end:payload_end])
+    if _zlib.crc32(payload) != checksum:
+        return None, offset
+    try:
+        return _json.loads(payload), payload_end
+    except ValueError:
+        return None, offset
+
+
+class BlockLog:
+    """
+    Append-only, crash-safe log of JSON records.
+    Appends write only the new frame, so the cost of a write is O(record size).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+
+    def open(self) -> List[dict]:
+        """
+        Read every intact record, truncate a torn tail if one is found
+        and open the log for appending.
+        """
+        records = []
+        offset = 0
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+
+        while offset < len(data):
+            record, next_offset = decode_frame(data, offset)
+            if record is None:
+                break
+            records.append(record)
+            offset = next_offset
+
+        if offset < len(data):
+            print(
+                f"Truncating torn tail of {self.path}: "
+                f"{len(data) - offset} bytes after offset {offset}."
+            )
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+                f.flush()
+                _os.fsync(f.fileno())
+
+        self._file = open(self.path, "ab")
+        return records
+
+    def append(self, record: dict) -> None:
+        """
+        Durably append a single record.
+        """
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(encode_frame(record))
+        self._file.flush()
+        _os.fsync(self._file.fileno())
+
+    def extend(self, records: Iterable[dict]) -> None:
+        """
+        Durably append several records with a single fsync.
+        """
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        for record in records:
+            self._file.write(encode_frame(record))
+        self._file.flush()
+        _os.fsync(self._file.fileno())
+
+    def records(self) -> Iterator[dict]:
+        """
+        Read the intact records one at a time, without loading the whole log.
+        Stops at a torn tail.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                length, checksum = FRAME_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or _zlib.crc32(payload) != checksum:
+                    return
+                yield _json.loads(payload)
+
+    def rewrite(self, records: Iterable[dict]) -> None:
+        """
+        Atomically replace the whole log with `records`.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(encode_frame(record))
+            f.flush()
+            _os.fsync(f.fileno())
+        self._close_file()
+        _os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+
+    def close(self) -> None:
+        self._close_file()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
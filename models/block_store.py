@@ -0,0 +1,334 @@
+# block_store.py
+import mmap as _mmap
+import os as _os
+import struct as _struct
+import threading as _threading
+import zlib as _zlib
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from models.block_log import FRAME_HEADER, decode_frame, encode_frame
+from models.hash_index import HashIndex
+
+# Index entry for height h lives at byte (h - 1) * INDEX_ENTRY.size of the index file:
+# <segment number:uint32><frame offset:uint64><frame length:uint32><block hash:32 bytes>
+INDEX_ENTRY = _struct.Struct("<IQI32s")
+
+
+class BlockStore:
+    """
+    Block storage made of size-capped, append-only segment files and an index file
+    that maps each height to (segment, offset, length, block hash), plus a persistent
+    hash index that maps each block hash back to its height.
+
+    Frames are read through `mmap` on demand, so reading any block is O(1) and never
+    parses more than that block. The store behaves like a read-only list of block
+    dicts: `len(store)`, `store[-1]`, slicing and iteration all work.
+
+    `hash_block` is only used to re-index frames found past the index during recovery;
+    regular appends receive the hash already computed by the caller.
+
+    Reads may run on many threads while one thread writes. A store lock covers the
+    index and the mappings, which are refreshed as the active segment grows, but not
+    the fsyncs of an append.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        hash_block: Callable[[dict], str],
+        segment_size: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.directory = directory
+        self.hash_block = hash_block
+        self.segment_size = segment_size
+        self.index_path = _os.path.join(directory, "index.dat")
+        self.hashes = HashIndex(_os.path.join(directory, "hashes.idx"))
+        self._index = bytearray()
+        self._index_file = None
+        self._segment_file = None
+        self._segment_number = 0
+        self._segment_length = 0
+        self._maps: Dict[int, _mmap.mmap] = {}
+        self._tip: Optional[dict] = None
+        self._lock = _threading.RLock()
+
+    # ------------------------------------------------------------------ sequence API
+
+    def __len__(self) -> int:
+        return len(self._index) // INDEX_ENTRY.size
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._read(height) for height in range(*item.indices(len(self)))]
+        with self._lock:
+            length = len(self)
+            if item < 0:
+                item += length
+            if not 0 <= item < length:
+                raise IndexError("block index out of range")
+            if item == length - 1 and self._tip is not None:
+                return self._tip
+            return self._read(item)
+
+    def __iter__(self) -> Iterator[dict]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def open(self) -> None:
+        """
+        Load the index and recover from a crash: index entries without an intact
+        frame are dropped, frames written after the last index entry are re-indexed
+        and a torn segment tail is truncated. The index file is only ever cut back
+        to its intact entries and appended to, never rewritten from scratch.
+        """
+        _os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self.index_path, "rb") as f:
+                index = bytearray(f.read())
+        except FileNotFoundError:
+            index = bytearray()
+        del index[len(index) - len(index) % INDEX_ENTRY.size:]
+        indexed_length = len(index)
+
+        # Drop trailing entries whose frame did not make it to disk
+        while index:
+            segment, offset, length, _ = INDEX_ENTRY.unpack_from(index, len(index) - INDEX_ENTRY.size)
+            if self._frame_is_intact(segment, offset, length):
+                break
+            del index[-INDEX_ENTRY.size:]
+
+        if index:
+            segment, offset, length, _ = INDEX_ENTRY.unpack_from(index, len(index) - INDEX_ENTRY.size)
+            self._segment_number, self._segment_length = segment, offset + length
+        else:
+            self._segment_number, self._segment_length = 0, 0
+
+        recovered = self._recover_segments()
+        with open(self.index_path, "a+b") as f:
+            f.truncate(indexed_length)
+            f.write(recovered)
+            f.flush()
+            _os.fsync(f.fileno())
+        self._index = index + recovered
+        self._index_file = open(self.index_path, "ab")
+        self._segment_file = open(self._segment_path(self._segment_number), "ab")
+        self._tip = self._read(len(self) - 1) if len(self) else None
+
+        self.hashes.open()
+        if self.hashes.height != len(self):
+            # Only happens after a crash between a store write and the index update
+            print(f"Hash index covers height {self.hashes.height}, store has {len(self)}: rebuilding.")
+            self.hashes.rebuild((self.hash_at(position), position + 1) for position in range(len(self)))
+            self.hashes.set_height(len(self))
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            self.hashes.close()
+
+    def _close_files(self) -> None:
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+        for f in (self._index_file, self._segment_file):
+            if f is not None:
+                f.close()
+        self._index_file = None
+        self._segment_file = None
+
+    def hash_at(self, position: int) -> str:
+        """
+        Return the stored hash of the block at `position` without reading the block.
+        """
+        with self._lock:
+            if position < 0:
+                position += len(self)
+            if not 0 <= position < len(self):
+                raise IndexError("block index out of range")
+            offset = position * INDEX_ENTRY.size + INDEX_ENTRY.size - 32
+            return bytes(self._index[offset:offset + 32]).hex()
+
+    def raw(self, position: int) -> bytes:
+        """
+        Return the stored JSON of the block at `position` without parsing it, for
+        handing blocks to clients and peers as they are.
+        """
+        with self._lock:
+            if position < 0:
+                position += len(self)
+            if not 0 <= position < len(self):
+                raise IndexError("block index out of range")
+            segment, offset, length, _ = INDEX_ENTRY.unpack_from(self._index, position * INDEX_ENTRY.size)
+            mapped = self._map(segment, offset + length)
+            payload_length, checksum = FRAME_HEADER.unpack_from(mapped, offset)
+            payload = mapped[offset + FRAME_HEADER.size:offset + FRAME_HEADER.size + payload_length]
+        if _zlib.crc32(payload) != checksum:
+            raise ValueError(f"Corrupt block frame at height {position + 1}")
+        return payload
+
+    def height_of(self, block_hash: str) -> Optional[int]:
+        """
+        Return the height of the block with `block_hash`, or None if it is not stored.
+        """
+        with self._lock:  # The hash index is remapped when it grows
+            return self.hashes.get(block_hash)
+
+    def append(self, block: dict, block_hash: str) -> None:
+        """
+        Durably append a block and its hash: the frame is fsynced before its
+        index entry, so every index entry always points at a complete frame.
+        """
+        frame = encode_frame(block)
+        if self._segment_length and self._segment_length + len(frame) > self.segment_size:
+            self._roll_segment()
+
+        offset = self._segment_length
+        self._segment_file.write(frame)
+        self._segment_file.flush()
+        _os.fsync(self._segment_file.fileno())
+        self._segment_length += len(frame)
+
+        entry = INDEX_ENTRY.pack(self._segment_number, offset, len(frame), bytes.fromhex(block_hash))
+        self._index_file.write(entry)
+        self._index_file.flush()
+        _os.fsync(self._index_file.fileno())
+        with self._lock:
+            self._index += entry
+            self._tip = block
+            self.hashes.put(block_hash, len(self))
+            self.hashes.set_height(len(self))
+
+    def extend(self, blocks: Iterable[dict], block_hashes: Iterable[str]) -> None:
+        for block, block_hash in zip(blocks, block_hashes):
+            self.append(block, block_hash)
+
+    def truncate(self, height: int) -> None:
+        """
+        Drop every block above `height`, keeping blocks 1..height.
+        """
+        with self._lock:
+            if height >= len(self):
+                return
+            self._close_files()
+            for position in range(height, len(self)):
+                self.hashes.remove(self.hash_at(position))
+            self.hashes.set_height(height)
+            del self._index[height * INDEX_ENTRY.size:]
+            if self._index:
+                segment, offset, length, _ = INDEX_ENTRY.unpack_from(self._index, len(self._index) - INDEX_ENTRY.size)
+                self._segment_number, self._segment_length = segment, offset + length
+            else:
+                self._segment_number, self._segment_length = 0, 0
+
+            # Cut the index file in place, so a reorg costs O(depth) and not O(chain)
+            with open(self.index_path, "r+b") as f:
+                f.truncate(len(self._index))
+                _os.fsync(f.fileno())
+            self._remove_segments_after(self._segment_number)
+            with open(self._segment_path(self._segment_number), "ab") as f:
+                f.truncate(self._segment_length)
+                _os.fsync(f.fileno())
+
+            self._index_file = open(self.index_path, "ab")
+            self._segment_file = open(self._segment_path(self._segment_number), "ab")
+            self._tip = self._read(len(self) - 1) if len(self) else None
+
+    def _segment_path(self, segment: int) -> str:
+        return _os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def _roll_segment(self) -> None:
+        self._segment_file.close()
+        self._segment_number += 1
+        self._segment_length = 0
+        self._segment_file = open(self._segment_path(self._segment_number), "ab")
+
+    def _map(self, segment: int, end: int) -> _mmap.mmap:
+        """
+        Return a read-only mapping of `segment` that covers at least `end` bytes.
+        The active segment grows, so its mapping is refreshed when it falls short.
+        Callers hold the store lock while they use the mapping.
+        """
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def _read(self, position: int) -> dict:
+        with self._lock:
+            segment, offset, length, _ = INDEX_ENTRY.unpack_from(self._index, position * INDEX_ENTRY.size)
+            mapped = self._map(segment, offset + length)
+            record, _ = decode_frame(mapped, offset)
+        if record is None:
+            raise ValueError(f"Corrupt block frame at height {position + 1}")
+        return record
+
+    def _frame_is_intact(self, segment: int, offset: int, length: int) -> bool:
+        try:
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+        except FileNotFoundError:
+            return False
+        record, end = decode_frame(data, 0)
+        return record is not None and end == length
+
+    def _recover_segments(self) -> bytearray:
+        """
+        Index the frames that follow the last indexed one, in the active segment and
+        in every later segment, truncating torn bytes at the end of a segment. The
+        active segment becomes the last one found. Segments past a missing segment
+        number cannot continue the chain and are removed.
+        """
+        entries = self._recover_segment_tail(self._segment_number, self._segment_length)
+        while _os.path.exists(self._segment_path(self._segment_number + 1)):
+            self._segment_number += 1
+            entries += self._recover_segment_tail(self._segment_number, 0)
+        self._remove_segments_after(self._segment_number)
+        return entries
+
+    def _recover_segment_tail(self, segment: int, offset: int) -> bytearray:
+        """
+        Index the frames of `segment` from `offset` on and truncate whatever torn
+        bytes come after them.
+        """
+        entries = bytearray()
+        path = self._segment_path(segment)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._segment_length = offset
+            return entries
+
+        while offset < len(data):
+            record, next_offset = decode_frame(data, offset)
+            if record is None:
+                break
+            block_hash = bytes.fromhex(self.hash_block(record))
+            entries += INDEX_ENTRY.pack(segment, offset, next_offset - offset, block_hash)
+            offset = next_offset
+
+        if offset < len(data):
+            print(f"Truncating torn tail of {path}: {len(data) - offset} bytes after offset {offset}.")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+                _os.fsync(f.fileno())
+        self._segment_length = offset
+        return entries
+
+    def _remove_segments_after(self, segment: int) -> None:
+        for name in _os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".log"):
+                number = int(name[len("segment-"):-len(".log")])
+                if number > segment:
+                    stale = self._maps.pop(number, None)
+                    if stale is not None:
+                        stale.close()
+                    _os.remove(_os.path.join(self.directory, name))
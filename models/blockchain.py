@@ -2,8 +2,61 @@
 import datetime as _dt
 import hashlib as _hashlib
 import json as _json
-from typing import List, Optional, Set
-import requests
+import os as _os
+import asyncio as _asyncio
+import threading as _threading
+from collections import OrderedDict
+from contextlib import aclosing as _aclosing
+from itertools import chain as _chain
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Set, Tuple
+import httpx
+from models.block_log import BlockLog
+from models.block_store import BlockStore
+from models.chain_validator import ChainValidator
+from models.compact_block import index_by_short_id, reconstruct_transactions, to_compact_block
+from models.mempool import Mempool
+from models.mempool_journal import MempoolJournal
+from models.merkle import merkle_proof, merkle_root
+from models.miner import BLOCK_WORK, ProofOfWorkMiner, is_valid_proof
+from models.nft_state import NFTStateIndex
+from models.orphan_pool import OrphanPool
+from models.side_chains import SideChains
+from models.sync_staging import SyncStaging
+
+if TYPE_CHECKING:
+    from utils.p2p_client import P2PClient
+
+# Mempool journal durability: "none", "batched" (group commit) or "per-tx"
+MEMPOOL_DURABILITY = _os.getenv("MEMPOOL_DURABILITY", "batched")
+MEMPOOL_BATCH_SIZE = int(_os.getenv("MEMPOOL_BATCH_SIZE", 256))
+MEMPOOL_BATCH_INTERVAL = float(_os.getenv("MEMPOOL_BATCH_INTERVAL", 0.05))  # seconds
+BLOCK_SEGMENT_SIZE = int(_os.getenv("BLOCK_SEGMENT_SIZE", 64 * 1024 * 1024))  # bytes
+# How to handle two pending transfers of one NFT: "first-seen" or "replace-by-price"
+MEMPOOL_CONFLICT_POLICY = _os.getenv("MEMPOOL_CONFLICT_POLICY", "first-seen")
+# Mempool bounds: transaction count, bytes of canonical transaction JSON and TTL in seconds
+MEMPOOL_MAX_TRANSACTIONS = int(_os.getenv("MEMPOOL_MAX_TRANSACTIONS", 50_000))
+MEMPOOL_MAX_BYTES = int(_os.getenv("MEMPOOL_MAX_BYTES", 64 * 1024 * 1024))
+MEMPOOL_TX_TTL = float(_os.getenv("MEMPOOL_TX_TTL", 3 * 60 * 60))
+# Block template limits, including the miner reward transaction
+MAX_BLOCK_TRANSACTIONS = int(_os.getenv("MAX_BLOCK_TRANSACTIONS", 1000))
+MAX_BLOCK_BYTES = int(_os.getenv("MAX_BLOCK_BYTES", 1024 * 1024))
+MINING_WORKERS = int(_os.getenv("MINING_WORKERS", 0)) or None  # Defaults to one per CPU core
+# Chain validation: worker processes (defaults to one per CPU core) and blocks per work unit
+VALIDATION_WORKERS = int(_os.getenv("VALIDATION_WORKERS", 0)) or None
+VALIDATION_CHUNK_SIZE = int(_os.getenv("VALIDATION_CHUNK_SIZE", 256))
+# Chain sync: largest header window when looking for the common ancestor, blocks per
+# download request, the timeout of each peer request and of a whole sync, in seconds
+SYNC_HEADER_BATCH = int(_os.getenv("SYNC_HEADER_BATCH", 512))
+SYNC_BLOCK_BATCH = int(_os.getenv("SYNC_BLOCK_BATCH", 500))
+SYNC_TIMEOUT = float(_os.getenv("SYNC_TIMEOUT", 5))
+SYNC_DEADLINE = float(_os.getenv("SYNC_DEADLINE", 30))
+# Orphan blocks: how many are held, for how many seconds, and how many missing
+# ancestors are fetched one by one before falling back to a chain sync
+ORPHAN_POOL_SIZE = int(_os.getenv("ORPHAN_POOL_SIZE", 100))
+ORPHAN_MAX_AGE = float(_os.getenv("ORPHAN_MAX_AGE", 600))
+ORPHAN_FETCH_DEPTH = int(_os.getenv("ORPHAN_FETCH_DEPTH", 32))
+# Deepest reorg handled with in-memory undo data; side chains forking deeper are dropped
+REORG_MAX_DEPTH = int(_os.getenv("REORG_MAX_DEPTH", 100))
 
 class NFT:
     def __init__(
@@ -79,6 +132,21 @@ class Transaction:
             "timestamp": self.timestamp,
         }
 
+    def canonical_bytes(self) -> bytes:
+        """
+        Canonical JSON encoding of the transaction, the same on every node.
+        """
+        canonical = self.to_dict()
+        canonical["price"] = float(self.price)  # 0 and 0.0 must encode alike
+        return _json.dumps(canonical, sort_keys=True, separators=(",", ":")).encode()
+
+    @property
+    def tx_id(self) -> str:
+        """
+        Canonical content hash of the transaction.
+        """
+        return _hashlib.sha256(self.canonical_bytes()).hexdigest()
+
     @staticmethod
     def from_dict(data: dict):
         nft_data = data.get('nft')
@@ -95,11 +163,97 @@ class Transaction:
         return _json.dumps(self.to_dict(), sort_keys=True)
 
 
+def transaction_id(tx_data: dict) -> str:
+    """
+    Transaction id of a transaction stored as a dict, e.g. inside a block.
+    """
+    return Transaction.from_dict(tx_data).tx_id
+
+
+HEADER_FIELDS = ("index", "timestamp", "merkle_root", "proof", "previous_hash")
+
+
+def block_header(block: dict) -> dict:
+    """
+    The block without its transactions, which are committed to by the Merkle root.
+    """
+    return {field: block.get(field) for field in HEADER_FIELDS}
+
+
+def block_merkle_root(block: dict) -> str:
+    return merkle_root([transaction_id(tx) for tx in block["transactions"]])
+
+
+def has_valid_merkle_root(block: dict) -> bool:
+    """
+    Whether the transactions of `block` are distinct and match its Merkle root.
+    The tree pairs an odd last leaf with itself, so a copy of the last transaction
+    appended to a block would leave the root, and so the block hash, unchanged.
+    """
+    tx_ids = [transaction_id(tx) for tx in block["transactions"]]
+    if len(set(tx_ids)) != len(tx_ids):
+        return False
+    return merkle_root(tx_ids) == block["merkle_root"]
+
+
+def is_block_hash(value: str) -> bool:
+    """
+    Whether `value` has the form of a block hash: a hex SHA-256 digest.
+    """
+    if not isinstance(value, str) or len(value) != 64:
+        return False
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        return False
+    return True
+
+
+def block_hash(block: dict) -> str:
+    """
+    Blocks with a Merkle root are identified by their header alone.
+    Older blocks without one are hashed in full, as they always were.
+    """
+    if block.get("merkle_root"):
+        encoded_block = _json.dumps(block_header(block), sort_keys=True).encode()
+    else:
+        legacy_block = {key: value for key, value in block.items() if key != "merkle_root"}
+        encoded_block = _json.dumps(legacy_block, sort_keys=True).encode()
+    return _hashlib.sha256(encoded_block).hexdigest()
+
+
 class Blockchain:
     def __init__(self) -> None:
-        self.chain: List[dict] = []
-        self.pending_transactions: List[Transaction] = []
-        self.chain_file = 'blockchain.json'
+        self.chain = BlockStore('blockchain_data', self._hash, segment_size=BLOCK_SEGMENT_SIZE)
+        # Blocks up to this height have been validated; only newer blocks need checking
+        self.validated_height = 0
+        # Pending transactions keyed by transaction id
+        self.mempool = Mempool(
+            conflict_policy=MEMPOOL_CONFLICT_POLICY,
+            max_transactions=MEMPOOL_MAX_TRANSACTIONS,
+            max_bytes=MEMPOOL_MAX_BYTES,
+            ttl=MEMPOOL_TX_TTL,
+            # Anything bigger could never be mined next to the miner reward
+            max_transaction_bytes=MAX_BLOCK_BYTES - self._reward_bytes(),
+        )
+        self.nft_state = NFTStateIndex()  # Current owner and price of every NFT
+        # Received blocks whose parent has not arrived yet
+        self.orphans = OrphanPool(max_orphans=ORPHAN_POOL_SIZE, max_age=ORPHAN_MAX_AGE)
+        # Valid blocks off the main chain, candidates for a reorg
+        self.side_chains = SideChains()
+        # NFT state undo data of the last REORG_MAX_DEPTH blocks, keyed by block hash
+        self._undo: "OrderedDict[str, dict]" = OrderedDict()
+        self.chain_file = 'blockchain.json'  # Legacy full-snapshot file, migrated on load
+        self.legacy_log_file = 'blockchain.log'  # Legacy single-file block log, migrated on load
+        self.mempool_journal = MempoolJournal(
+            'mempool.journal',
+            durability=MEMPOOL_DURABILITY,
+            batch_size=MEMPOOL_BATCH_SIZE,
+            batch_interval=MEMPOOL_BATCH_INTERVAL,
+        )
+        self._lock = _threading.RLock()  # Guards chain and mempool mutations
+        self.miner = ProofOfWorkMiner(workers=MINING_WORKERS)
+        self.validator = ChainValidator(workers=VALIDATION_WORKERS, chunk_size=VALIDATION_CHUNK_SIZE)
         self.nodes: Set[str] = set()  # Set to store node addresses
 
         # Attempt to load the blockchain from file
@@ -111,55 +265,223 @@ class Blockchain:
                 index=1,
                 transactions=[],
             )
-            self.chain.append(genesis_block)
-            # Save the new blockchain to file
-            self.save_to_file()
+            self._append_block(genesis_block)
+
+    @property
+    def pending_transactions(self) -> List[Transaction]:
+        return list(self.mempool)
 
     def _remove_transactions(self, new_block_transactions: List[dict]):
         """
-        Remove transactions from pending_transactions that are included in the new block.
+        Remove transactions from the mempool that are included in the new block.
         """
-        new_block_txs = set()
-        for tx in new_block_transactions:
-            tx_str = _json.dumps(tx, sort_keys=True)
-            new_block_txs.add(tx_str)
-
-        updated_pending = []
-        for tx in self.pending_transactions:
-            if _json.dumps(tx.to_dict(), sort_keys=True) not in new_block_txs:
-                updated_pending.append(tx)
-        self.pending_transactions = updated_pending
-        self.save_to_file()
+        with self._lock:
+            self.mempool.remove(transaction_id(tx) for tx in new_block_transactions)
+            # Pending transfers of NFTs the block moved are void unless the new owner sent them
+            for tx in new_block_transactions:
+                nft_data = tx.get("nft")
+                if not nft_data:
+                    continue
+                pending = self.mempool.pending_for_dna(nft_data["dna"])
+                if pending and pending.sender != self.nft_state.owner_of(nft_data["dna"]):
+                    self.mempool.remove([pending.tx_id])
+            self._compact_mempool_journal()
         print("Pending transactions updated after adding new block.")
 
     def add_block(self, block_data: dict) -> bool:
         """
-        Add a received block to the chain after verification.
+        Add a received block after verification. It either extends the tip, or a side
+        chain, which becomes the main chain once it carries more cumulative work. A
+        block whose parent we do not have yet is held in the orphan pool; orphans
+        waiting on a new block are added right after it.
+        Returns True if the block was new and valid.
         """
-        previous_block = self.get_previous_block()
-        if previous_block['index'] + 1 != block_data['index']:
-            print(f"Invalid index: expected {previous_block['index'] + 1}, got {block_data['index']}")
-            return False
+        with self._lock:
+            block_hash = self._hash(block_data)
+            if not self._add_block(block_data, block_hash):
+                return False
+            self._connect_orphans([block_hash])
+        return True
 
-        # Verify previous hash
-        previous_block_hash = self._hash(previous_block)
-        if previous_block_hash != block_data['previous_hash']:
-            print(f"Invalid previous hash: expected {previous_block_hash}, got {block_data['previous_hash']}")
+    def _connect_orphans(self, parent_hashes: List[str]) -> None:
+        """
+        Add the orphans waiting on any of `parent_hashes`, then the ones waiting on those.
+        """
+        parents = list(parent_hashes)
+        while parents:
+            for child, child_hash in self.orphans.pop_children(parents.pop()):
+                if self._add_block(child, child_hash):
+                    parents.append(child_hash)
+
+    def _add_block(self, block_data: dict, block_hash: str) -> bool:
+        if self.has_block(block_hash):
+            return False
+        if not is_block_hash(block_data['previous_hash']):
+            # E.g. another network's genesis block, whose previous hash is "0"
+            print(f"Block {block_data['index']} has no valid previous hash.")
+            return False
+        parent = self._get_known_block(block_data['previous_hash'])
+        if parent is None:
+            if self.orphans.add(block_data, block_hash):
+                print(f"Block {block_data['index']} is an orphan, holding it until its parent arrives.")
+            return False
+        parent_block, parent_work = parent
+        if not self._is_valid_next_block(parent_block, block_data['previous_hash'], block_data):
+            print(f"Block {block_data['index']} failed validation.")
             return False
 
-        if not self.is_chain_valid(self.chain + [block_data]):
-            print("Chain validation failed after adding the new block.")
+        if block_data['previous_hash'] == self.chain.hash_at(-1):
+            self._append_block(block_data, block_hash)
+            print(f"Block {block_data['index']} added successfully.")
+            # A competing block won this height, so stop searching for our own
+            self.miner.cancel(block_data['index'])
+            # Remove transactions from pending_transactions that are included in the new block
+            self._remove_transactions(block_data['transactions'])
+            self.side_chains.prune(len(self.chain) - REORG_MAX_DEPTH)
+            return True
+
+        if block_data['index'] <= len(self.chain) - REORG_MAX_DEPTH:
+            print(f"Block {block_data['index']} forks too deep below the tip, ignoring it.")
             return False
+        work = parent_work + BLOCK_WORK
+        self.side_chains.add(block_data, block_hash, work)
+        print(f"Block {block_data['index']} extends a side chain.")
+        if work > self.chain_work():
+            return self._reorganize(block_hash)
+        return True
 
-        self.chain.append(block_data)
-        self.save_to_file()
-        print(f"Block {block_data['index']} added successfully.")
+    def has_block(self, block_hash: str) -> bool:
+        return self.height_of(block_hash) is not None or block_hash in self.side_chains
 
-        # Remove transactions from pending_transactions that are included in the new block
-        self._remove_transactions(block_data['transactions'])
+    def _get_known_block(self, block_hash: str):
+        """
+        Return (block, cumulative work up to it) for a block on the main chain or a
+        side chain, or None if unknown.
+        """
+        height = self.height_of(block_hash)
+        if height is not None:
+            return self.chain[height - 1], height * BLOCK_WORK
+        return self.side_chains.get(block_hash)
+
+    def chain_work(self) -> int:
+        # Difficulty is fixed, so every block carries the same work
+        return len(self.chain) * BLOCK_WORK
 
+    def _reorganize(self, tip_hash: str) -> bool:
+        """
+        Switch the main chain to the side chain ending at `tip_hash`. Only the blocks
+        after the fork point are disconnected and connected, using undo data.
+        Returns False if the side chain no longer connects to the main chain.
+        """
+        branch = self.side_chains.branch(tip_hash)
+        fork_height = self.height_of(branch[0][0]['previous_hash'])
+        if fork_height is None:
+            # The bottom of the branch was pruned, so it can no longer connect
+            for _, block_hash in branch:
+                self.side_chains.remove(block_hash)
+            print(f"Side chain ending at block {branch[-1][0]['index']} no longer connects, dropping it.")
+            return False
+        disconnected = self._disconnect_to(fork_height)
+        for block, block_hash in disconnected:
+            self.side_chains.add(block, block_hash, block['index'] * BLOCK_WORK)
+        for block, block_hash in branch:
+            self.side_chains.remove(block_hash)
+            self._append_block(block, block_hash)
+        print(f"Reorganised to block {branch[-1][0]['index']}: {len(disconnected)} blocks disconnected, {len(branch)} connected.")
+        self._after_tip_change(disconnected, [tx for block, _ in branch for tx in block['transactions']])
         return True
 
+    def _disconnect_to(self, height: int) -> List[tuple]:
+        """
+        Disconnect every block above `height` and revert its NFT state changes.
+        Returns the disconnected (block, hash) pairs, oldest first.
+        """
+        disconnected = []
+        rebuild = False
+        for position in range(len(self.chain) - 1, height - 1, -1):
+            block_hash = self.chain.hash_at(position)
+            undo = self._undo.pop(block_hash, None)
+            if undo is None:
+                rebuild = True  # Older than the undo data kept in memory
+            elif not rebuild:
+                self.nft_state.undo_block(undo)
+            disconnected.append((self.chain[position], block_hash))
+        self.chain.truncate(height)
+        self.validated_height = len(self.chain)
+        if rebuild:
+            self.nft_state.rebuild(self.chain)
+        disconnected.reverse()
+        return disconnected
+
+    def _after_tip_change(self, disconnected: List[tuple], confirmed_transactions: List[dict]) -> None:
+        """
+        Return transactions of disconnected blocks that did not make it into the new
+        chain to the mempool, and remove the ones the new blocks confirmed.
+        """
+        confirmed = {transaction_id(tx) for tx in confirmed_transactions}
+        # The NFTs the disconnected blocks moved may have reverted to an earlier owner,
+        # so pending transfers made by a later owner are void
+        for block, _ in disconnected:
+            for tx in block['transactions']:
+                if not tx.get('nft'):
+                    continue
+                pending = self.mempool.pending_for_dna(tx['nft']['dna'])
+                if pending and not self._is_spendable(pending):
+                    self.mempool.remove([pending.tx_id])
+                    self.mempool_journal.append({"remove": pending.tx_id})
+        for block, _ in disconnected:
+            for tx in block['transactions']:
+                if tx['sender'] == "SYSTEM" and not tx.get('nft'):
+                    continue  # Mining rewards are only valid in their own block
+                transaction = Transaction.from_dict(tx)
+                if transaction.tx_id in confirmed or not self._is_spendable(transaction):
+                    continue
+                try:
+                    for dropped_tx in self.mempool.add(transaction):
+                        self.mempool_journal.append({"remove": dropped_tx.tx_id})
+                    self.mempool_journal.append(self._journal_record(transaction))
+                except ValueError as e:
+                    print(f"Not returning transaction {transaction.tx_id} to the mempool: {e}")
+        # The tip moved, so any block being mined is stale
+        self.miner.cancel()
+        self._remove_transactions(confirmed_transactions)
+        self.side_chains.prune(len(self.chain) - REORG_MAX_DEPTH)
+
+    def _is_spendable(self, transaction: Transaction) -> bool:
+        """
+        Whether the sender may transfer the NFT under the current world state.
+        """
+        if not transaction.nft:
+            return True
+        owner = self.nft_state.owner_of(transaction.nft.dna)
+        return transaction.sender == (owner or "SYSTEM")
+
+    def is_orphan(self, block_data: dict) -> bool:
+        return self._hash(block_data) in self.orphans
+
+    async def accept_block(self, client: "P2PClient", block: dict, sender: Optional[str]) -> bool:
+        """
+        Add a block received from `sender`. If it turns out to be an orphan, fetch
+        only its missing ancestors from `sender`, one by one, until it connects.
+        Returns True once the block is on our main chain or a side chain.
+        """
+        if await _asyncio.to_thread(self.add_block, block):
+            return True
+        block_hash = self._hash(block)
+        if sender is None or block_hash not in self.orphans:
+            return False
+        for _ in range(ORPHAN_FETCH_DEPTH):
+            missing_hash = self.orphans.missing_ancestor(block_hash)
+            if missing_hash is None:
+                break  # Connected, or evicted
+            parent = await client.get_json(sender, '/api/block', timeout=SYNC_TIMEOUT, hash=missing_hash)
+            if self._hash(parent) != missing_hash:
+                raise ValueError(f"{sender} answered with the wrong block for hash {missing_hash}")
+            added = await _asyncio.to_thread(self.add_block, parent)
+            if not added and missing_hash not in self.orphans:
+                return False  # The ancestor does not connect to our chain
+        return self.has_block(block_hash)
+
     # Node registration method
     def register_node(self, address: str):
         """
@@ -170,50 +492,336 @@ class Blockchain:
         print(f"Node {address} registered. Total nodes: {len(self.nodes)}")
 
     # Chain replacement method
-    def replace_chain(self) -> bool:
+    async def replace_chain(self, client: "P2PClient") -> bool:
         """
-        Replace the chain with the longest one in the network if it's valid.
+        Catch up with a valid chain in the network that has more cumulative work.
+
+        All peers are asked for their tip at once; the first peer that answers with
+        more work and syncs successfully wins, so slow or dead peers do not hold the
+        sync up. The whole sync is bounded by SYNC_DEADLINE seconds. Validation and
+        storage run in a worker thread to keep the event loop free.
         """
-        network = self.nodes
-        longest_chain = None
-        max_length = len(self.chain)
+        try:
+            return await _asyncio.wait_for(self._sync_with_peers(client), timeout=SYNC_DEADLINE)
+        except _asyncio.TimeoutError:
+            print(f"Chain sync did not finish within {SYNC_DEADLINE} seconds.")
+            return False
 
-        for node in network:
-            try:
-                response = requests.get(f'{node}/api/blockchain')
-                if response.status_code == 200:
-                    length = response.json()['length']
-                    chain = response.json()['chain']
-                    if length > max_length and self.is_chain_valid(chain):
-                        max_length = length
-                        longest_chain = chain
-            except requests.exceptions.RequestException:
-                continue  # Skip nodes that are not reachable
-
-        if longest_chain:
-            self.chain = longest_chain
-            self.save_to_file()
-            print("Chain was replaced with the longest one.")
-            return True
+    async def _sync_with_peers(self, client: "P2PClient") -> bool:
+        work = self.chain_work()
+        polls = [_asyncio.ensure_future(self._poll_tip(client, node)) for node in list(self.nodes)]
+        try:
+            for next_tip in _asyncio.as_completed(polls):
+                node, tip = await next_tip
+                if tip is None or tip.get('work', tip['height'] * BLOCK_WORK) <= work:
+                    continue
+                try:
+                    if await self._sync_from(client, node, tip['height']):
+                        print(f"Chain was synced to height {len(self.chain)} from {node}.")
+                        return True
+                except (httpx.HTTPError, ValueError, KeyError) as e:
+                    print(f"Sync from {node} failed: {e}")
+        finally:
+            for poll in polls:
+                poll.cancel()
 
         print("Current chain is already the longest.")
         return False
 
+    async def _poll_tip(self, client: "P2PClient", node: str):
+        try:
+            return node, await client.get_json(node, '/api/tip', timeout=SYNC_TIMEOUT)
+        except (httpx.HTTPError, ValueError):
+            return node, None  # Skip nodes that are not reachable
+
+    async def _sync_from(self, client: "P2PClient", node: str, peer_height: int) -> bool:
+        """
+        Download the blocks of `node` past our common ancestor, validate them as they
+        arrive and switch to them if they give the chain more cumulative work.
+        """
+        ancestor = await self._find_common_ancestor(client, node, peer_height)
+        ancestor_hash = self.chain.hash_at(ancestor - 1) if ancestor else None
+        previous_block = self.chain[ancestor - 1] if ancestor else None
+
+        # Memory holds at most two windows of SYNC_BLOCK_BATCH blocks: one being
+        # validated and taken in while the next one downloads.
+        staging = SyncStaging()
+        received = 0
+        previous_hash = ancestor_hash
+        validation = None
+        window: List[dict] = []
+        try:
+            blocks = client.stream_json_lines(
+                node,
+                '/api/blocks',
+                timeout=SYNC_TIMEOUT,
+                from_height=ancestor + 1,
+                limit=peer_height - ancestor,
+                stream='true',
+            )
+            async with _aclosing(blocks):
+                async for block in blocks:
+                    # Cheap checks as each block arrives; hashes and PoW are checked per window
+                    received += 1
+                    if block['index'] != ancestor + received:
+                        print(f"Unexpected block {block['index']} from {node}, expected {ancestor + received}")
+                        return staging.connected
+                    window.append(block)
+                    if len(window) < SYNC_BLOCK_BATCH:
+                        continue
+                    if validation is not None:
+                        previous_hash = await validation
+                        if previous_hash is None:
+                            print(f"Invalid blocks from {node}")
+                            return staging.connected
+                    validation = _asyncio.ensure_future(_asyncio.to_thread(
+                        self._sync_window, staging, ancestor, ancestor_hash, previous_block, previous_hash, window
+                    ))
+                    previous_block, window = window[-1], []
+            if validation is not None:
+                previous_hash = await validation
+                if previous_hash is None:
+                    print(f"Invalid blocks from {node}")
+                    return staging.connected
+            if window and await _asyncio.to_thread(
+                self._sync_window, staging, ancestor, ancestor_hash, previous_block, previous_hash, window
+            ) is None:
+                print(f"Invalid blocks from {node}")
+            return staging.connected
+        finally:
+            if validation is not None:
+                validation.cancel()  # Its thread still finishes the window it is taking in
+            staging.close()
+
+    def _sync_window(
+        self,
+        staging: SyncStaging,
+        ancestor: int,
+        ancestor_hash: Optional[str],
+        previous_block: Optional[dict],
+        previous_hash: Optional[str],
+        blocks: List[dict],
+    ) -> Optional[str]:
+        """
+        Validate a window of blocks downloaded past `ancestor` and take it in. Windows
+        are staged until the downloaded branch has more cumulative work than our chain.
+        Then the staged blocks are connected, and every later window is connected as
+        soon as it is validated, so a sync that is cut short keeps its progress.
+        Returns the hash of the last block, or None if the sync has to stop.
+        """
+        block_hashes = self._validate_extension(previous_block, previous_hash, blocks)
+        if not block_hashes:
+            return None
+        with staging.use() as active:
+            if not active:
+                return None  # The sync was abandoned
+            with self._lock:
+                if staging.connected:
+                    if not self._connect_synced_blocks(len(self.chain), previous_hash, zip(blocks, block_hashes)):
+                        return None
+                elif (ancestor + staging.count + len(blocks)) * BLOCK_WORK <= self.chain_work():
+                    staging.extend(zip(blocks, block_hashes))
+                else:
+                    if not self._connect_synced_blocks(
+                        ancestor, ancestor_hash, _chain(staging.blocks(), zip(blocks, block_hashes))
+                    ):
+                        return None
+                    staging.connected = True
+        return block_hashes[-1]
+
+    def _validate_extension(
+        self, previous_block: Optional[dict], previous_hash: Optional[str], blocks: List[dict]
+    ) -> Optional[List[str]]:
+        """
+        Validate `blocks` as a run of consecutive blocks following `previous_block`, or
+        starting a new chain at genesis if it is None. Returns their hashes, or None.
+        """
+        expected_index = previous_block['index'] + 1 if previous_block else 1
+        if blocks and blocks[0]['index'] != expected_index:
+            print(f"Unexpected block {blocks[0]['index']}, expected {expected_index}")
+            return None
+        return self.validator.validate(blocks, previous_block, previous_hash)
+
+    def _connect_synced_blocks(
+        self, ancestor: int, ancestor_hash: Optional[str], blocks: Iterable[tuple]
+    ) -> bool:
+        """
+        Replace everything above `ancestor` with the (block, hash) pairs in `blocks`,
+        disconnecting only the blocks past the ancestor. Blocks are consumed one at a
+        time. The caller checks that this gives the chain more cumulative work.
+        """
+        with self._lock:
+            if ancestor and self.chain.hash_at(ancestor - 1) != ancestor_hash:
+                print("Our chain changed during the sync, retrying on the next one.")
+                return False
+            disconnected = self._disconnect_to(ancestor)
+            for block, block_hash in disconnected:
+                self.side_chains.add(block, block_hash, block['index'] * BLOCK_WORK)
+
+            # Only transactions that are pending, or were in a disconnected block, or
+            # move an NFT with a pending transfer can change the mempool
+            watched_ids = {tx_id for tx_id, _ in self.mempool.items()}
+            watched_dnas = {tx.nft.dna for _, tx in self.mempool.items() if tx.nft}
+            for block, _ in disconnected:
+                for tx in block['transactions']:
+                    watched_ids.add(transaction_id(tx))
+                    if tx.get('nft'):
+                        watched_dnas.add(tx['nft']['dna'])
+            confirmed: List[dict] = []
+            waited_on: List[str] = []
+            for block, block_hash in blocks:
+                self.side_chains.remove(block_hash)
+                self._append_block(block, block_hash)
+                confirmed.extend(
+                    tx for tx in block['transactions']
+                    if transaction_id(tx) in watched_ids or (tx.get('nft') and tx['nft']['dna'] in watched_dnas)
+                )
+                if self.orphans.has_children(block_hash):
+                    waited_on.append(block_hash)
+            self._after_tip_change(disconnected, confirmed)
+            self._connect_orphans(waited_on)
+        return True
+
+    async def _find_common_ancestor(self, client: "P2PClient", node: str, peer_height: int) -> int:
+        """
+        Return the height of the highest block we share with `node`, or 0 if even the
+        genesis blocks differ. Headers are requested in windows that walk back from our
+        tip and double in size, so a peer that extends our chain costs a single header.
+        """
+        top = min(len(self.chain), peer_height)
+        window = 1
+        while top > 0:
+            start = max(1, top - window + 1)
+            headers = await client.get_json(
+                node, '/api/headers', timeout=SYNC_TIMEOUT, from_height=start, limit=top - start + 1
+            )
+            for header in reversed(headers):
+                height = header['index']
+                if start <= height <= top and header['hash'] == self.chain.hash_at(height - 1):
+                    return height
+            top = start - 1
+            window = min(window * 2, SYNC_HEADER_BATCH)
+        return 0
+
+    def compact_block(self, block: dict) -> dict:
+        """
+        Header plus short transaction ids, for relaying a block to peers that already
+        hold most of its transactions in their mempool.
+        """
+        tx_ids = [transaction_id(tx) for tx in block["transactions"]]
+        return to_compact_block(block, block_header(block), tx_ids)
+
+    async def rebuild_compact_block(self, client: "P2PClient", compact: dict, sender: str) -> Optional[dict]:
+        """
+        Rebuild a block announced in compact form from the mempool, fetching only the
+        transactions we lack from `sender`. Returns None if we already have the block.
+        """
+        header = compact["header"]
+        if not header.get("merkle_root"):
+            raise ValueError("Compact blocks must commit to their transactions with a Merkle root.")
+        block_hash = self._hash(header)
+        if self.has_block(block_hash) or block_hash in self.orphans:
+            return None
+
+        transactions, missing = await _asyncio.to_thread(self._reconstruct_transactions, compact)
+        if missing:
+            fetched = await client.get_json(
+                sender, '/api/block_transactions', timeout=SYNC_TIMEOUT, hash=block_hash, positions=missing
+            )
+            if len(fetched) != len(missing):
+                raise ValueError(f"Expected {len(missing)} transactions from {sender}, got {len(fetched)}")
+            for position, tx in zip(missing, fetched):
+                transactions[position] = tx
+        print(f"Rebuilt block {header['index']} from the mempool, fetched {len(missing)} of {len(transactions)} transactions.")
+
+        block = {**header, "transactions": transactions}
+        if await _asyncio.to_thread(block_merkle_root, block) != header["merkle_root"]:
+            # A short id collision picked the wrong transaction; fall back to the full block
+            block = await client.get_json(sender, '/api/block', timeout=SYNC_TIMEOUT, hash=block_hash)
+        return block
+
+    def _reconstruct_transactions(self, compact: dict):
+        with self._lock:
+            pending = index_by_short_id(self.mempool.items())
+
+        def lookup(short_id: str) -> Optional[dict]:
+            transaction = pending.get(short_id)
+            return transaction.to_dict() if transaction else None
+
+        return reconstruct_transactions(compact, lookup)
+
+    def get_tip(self) -> dict:
+        with self._lock:
+            return {
+                "height": len(self.chain),
+                "work": self.chain_work(),
+                "index": self.get_previous_block()["index"],
+                "hash": self.chain.hash_at(-1),
+            }
+
+    def get_headers(self, from_height: int, limit: int) -> List[dict]:
+        """
+        Headers of blocks from_height..from_height + limit - 1 with their stored hashes.
+        """
+        headers = []
+        for position in range(from_height - 1, min(from_height - 1 + limit, len(self.chain))):
+            header = block_header(self.chain[position])
+            header["hash"] = self.chain.hash_at(position)
+            headers.append(header)
+        return headers
+
+    def get_blocks(self, from_height: int, limit: int) -> List[dict]:
+        """
+        Blocks from_height..from_height + limit - 1, exactly as stored so their hashes hold.
+        """
+        return self.chain[from_height - 1:from_height - 1 + limit]
+
+    def iter_blocks(self, from_height: int, limit: Optional[int] = None) -> Iterator[dict]:
+        """
+        Like get_blocks, but reads the blocks one at a time as they are consumed.
+        Stops early if the chain gets shorter meanwhile.
+        """
+        end = from_height - 1 + limit if limit is not None else len(self.chain)
+        for position in range(from_height - 1, min(end, len(self.chain))):
+            try:
+                yield self.chain[position]
+            except IndexError:
+                return
+
+    def iter_block_json(self, from_height: int, limit: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Like iter_blocks, but yields the stored JSON of each block without parsing it.
+        """
+        end = from_height - 1 + limit if limit is not None else len(self.chain)
+        for position in range(from_height - 1, min(end, len(self.chain))):
+            try:
+                yield self.chain.raw(position)
+            except IndexError:
+                return
+
     def create_transaction(self, transaction: Transaction) -> int:
-        self.pending_transactions.append(transaction)
-        # Save after creating a transaction
-        self.save_to_file()
+        with self._lock:
+            # Raises DuplicateTransactionError, ConflictingTransactionError, MempoolFullError,
+            # or ValueError for a transaction too large to mine
+            dropped = self.mempool.add(transaction)
+            for dropped_tx in dropped:
+                self.mempool_journal.append({"remove": dropped_tx.tx_id})
+            self.mempool_journal.append(self._journal_record(transaction))
         return self.get_previous_block()["index"] + 1
 
     def mine_block(self, miner_address: str) -> dict:
-        if not self.pending_transactions:
-            raise ValueError("No transactions to mine.")
+        with self._lock:
+            self.mempool.expire()
+            if not self.mempool:
+                raise ValueError("No transactions to mine.")
+            pending_transactions = self._build_block_template(miner_address)
+            previous_block = self.get_previous_block()
+            previous_hash = self.chain.hash_at(-1)
 
-        previous_block = self.get_previous_block()
         previous_proof = previous_block["proof"]
-        index = len(self.chain) + 1
+        index = previous_block["index"] + 1
+        # Proof of work runs without the lock so admissions are not blocked meanwhile
         proof = self._proof_of_work(previous_proof, index)
-        previous_hash = self._hash(previous_block)
 
         # Add a reward transaction for the miner
         system_transaction = Transaction(
@@ -222,7 +830,7 @@ class Blockchain:
             nft=None,
             price=0,
         )
-        all_transactions = self.pending_transactions.copy()
+        all_transactions = pending_transactions
         all_transactions.append(system_transaction)
 
         block = self._create_block(
@@ -231,31 +839,43 @@ class Blockchain:
             index=index,
             transactions=[tx.to_dict() for tx in all_transactions],
         )
-        self.chain.append(block)
-        self.pending_transactions = []
-        # Save after mining a block
-        self.save_to_file()
+        with self._lock:
+            if self.get_previous_block() is not previous_block:
+                raise ValueError("The chain tip changed while mining, block discarded.")
+            self._append_block(block)
+            # Transactions left out of the template or admitted while mining stay pending
+            self._remove_transactions(block["transactions"])
+            self.side_chains.prune(len(self.chain) - REORG_MAX_DEPTH)
         print(f"Block {index} mined successfully.")
         return block
 
-    def _hash(self, block: dict) -> str:
-        encoded_block = _json.dumps(block, sort_keys=True).encode()
-        return _hashlib.sha256(encoded_block).hexdigest()
-
-    def _proof_of_work(self, previous_proof: int, index: int) -> int:
-        new_proof = 1
-        check_proof = False
+    @staticmethod
+    def _reward_bytes(miner_address: str = "") -> int:
+        reward = Transaction(sender="SYSTEM", receiver=miner_address, nft=None, price=0)
+        return len(reward.canonical_bytes())
 
-        while not check_proof:
-            to_digest = str(new_proof**2 - previous_proof**2 + index).encode()
-            hash_value = _hashlib.sha256(to_digest).hexdigest()
+    def _build_block_template(self, miner_address: str) -> List[Transaction]:
+        """
+        Select the pending transactions for the next block within the block limits,
+        leaving room for the miner reward. Everything else stays in the mempool.
+        """
+        selected = self.mempool.select_for_block(
+            max_transactions=MAX_BLOCK_TRANSACTIONS - 1,
+            max_bytes=MAX_BLOCK_BYTES - self._reward_bytes(miner_address),
+        )
+        if not selected:
+            raise ValueError("No pending transaction fits within the block size limit.")
+        return selected
 
-            if hash_value[:4] == "0000":
-                check_proof = True
-            else:
-                new_proof += 1
+    def _hash(self, block: dict) -> str:
+        return block_hash(block)
 
-        return new_proof
+    def _proof_of_work(self, previous_proof: int, index: int) -> int:
+        """
+        Search for a proof on all cores. Raises MiningCancelled if another block
+        is accepted at `index` while searching.
+        """
+        return self.miner.mine(previous_proof, index)
 
     def get_previous_block(self) -> dict:
         return self.chain[-1]
@@ -267,74 +887,205 @@ class Blockchain:
             "index": index,
             "timestamp": str(_dt.datetime.now()),
             "transactions": transactions,
+            "merkle_root": merkle_root([transaction_id(tx) for tx in transactions]),
             "proof": proof,
             "previous_hash": previous_hash,
         }
         return block
 
-    def is_chain_valid(self, chain: Optional[List[dict]] = None) -> bool:
-        if chain is None:
-            chain = self.chain
-        current_block = chain[0]
-        block_index = 1
+    def _is_valid_next_block(self, previous_block: dict, previous_hash: str, block: dict) -> bool:
+        """
+        Check that `block` correctly extends `previous_block`, whose hash is `previous_hash`.
+        """
+        if block["index"] != previous_block["index"] + 1:
+            print(f"Invalid index at block {block['index']}")
+            return False
 
-        while block_index < len(chain):
-            next_block = chain[block_index]
+        # Verify previous hash
+        if block["previous_hash"] != previous_hash:
+            print(f"Invalid previous hash at block {block['index']}")
+            return False
 
-            # Verify previous hash
-            if next_block["previous_hash"] != self._hash(current_block):
-                print(f"Invalid previous hash at block {block_index}")
-                return False
+        # Verify proof of work
+        if not is_valid_proof(previous_block["proof"], block["proof"], block["index"]):
+            print(f"Invalid proof of work at block {block['index']}")
+            return False
 
-            # Verify proof of work
-            current_proof = current_block["proof"]
-            next_proof = next_block["proof"]
-            index = next_block["index"]
+        # The header hash only covers the transactions through the Merkle root
+        if block.get("merkle_root") and not has_valid_merkle_root(block):
+            print(f"Invalid Merkle root or duplicate transaction at block {block['index']}")
+            return False
 
-            to_digest = str(next_proof**2 - current_proof**2 + index).encode()
-            hash_value = _hashlib.sha256(to_digest).hexdigest()
-            if hash_value[:4] != "0000":
-                print(f"Invalid proof of work at block {block_index}")
-                return False
+        return True
+
+    def _validate_chain(self, chain) -> Optional[List[str]]:
+        """
+        Validate every link of `chain`, hashing each block exactly once. Long chains
+        are hashed and proof-checked in parallel by the validator's worker processes.
+        Returns the block hashes, or None if the chain is invalid.
+        """
+        return self.validator.validate(chain)
 
-            current_block = next_block
-            block_index += 1
+    def is_chain_valid(self, chain: Optional[List[dict]] = None, full: bool = False) -> bool:
+        """
+        Validate a chain. For the local chain this is an O(1) watermark check, since
+        blocks are validated once when appended. `full=True` runs a complete audit that
+        re-hashes every stored block and compares it with the stored hash.
+        """
+        if chain is not None:
+            return self._validate_chain(chain) is not None
+        if not full:
+            return self.validated_height == len(self.chain)
 
+        block_hashes = self._validate_chain(self.chain)
+        if block_hashes is None:
+            return False
+        for position, block_hash in enumerate(block_hashes):
+            if self.chain.hash_at(position) != block_hash:
+                print(f"Stored hash mismatch at block {position + 1}")
+                return False
         return True
 
     def get_block_by_index(self, index: int) -> Optional[dict]:
-        for block in self.chain:
-            if block['index'] == index:
-                return block
-        return None
+        # Indexes are dense and start at 1, so the block lives at position index - 1
+        if not 1 <= index <= len(self.chain):
+            return None
+        block = self.chain[index - 1]
+        return block if block['index'] == index else None
 
-    def get_block_by_hash(self, hash_value: str) -> Optional[dict]:
-        for block in self.chain:
-            block_hash = self._hash(block)
-            if block_hash == hash_value:
-                return block
-        return None
-
-    def save_to_file(self):
-        data = {
-            'chain': self.chain,
-            'pending_transactions': [tx.to_dict() for tx in self.pending_transactions]
+    def get_inclusion_proof(self, block: dict, position: int) -> dict:
+        """
+        Build a Merkle inclusion proof for the transaction at `position` in `block`.
+        """
+        tx_ids = [transaction_id(tx) for tx in block["transactions"]]
+        return {
+            "block_index": block["index"],
+            "block_hash": self._hash(block),
+            "header": block_header(block),
+            "transaction": block["transactions"][position],
+            "tx_id": tx_ids[position],
+            "merkle_proof": merkle_proof(tx_ids, position),
         }
-        with open(self.chain_file, 'w') as f:
-            _json.dump(data, f, indent=4)
-        print("Blockchain saved to file.")
+
+    def get_block_by_hash(self, hash_value: str) -> Optional[dict]:
+        """
+        The block with `hash_value` on the main chain or, since we relay those too,
+        on a side chain.
+        """
+        height = self.height_of(hash_value)
+        if height is not None:
+            return self.chain[height - 1]
+        side_block = self.side_chains.get(hash_value)
+        return side_block[0] if side_block else None
+
+    def height_of(self, hash_value: str) -> Optional[int]:
+        try:
+            return self.chain.height_of(hash_value)
+        except ValueError:
+            return None  # Not a hex digest
+
+    def get_block_and_hash(self, index: int) -> Optional[Tuple[dict, str]]:
+        """
+        The block at `index` with its stored hash, read together so that a concurrent
+        reorg cannot pair a block with another block's hash.
+        """
+        with self._lock:
+            if not 1 <= index <= len(self.chain):
+                return None
+            return self.chain[index - 1], self.chain.hash_at(index - 1)
+
+    def _append_block(self, block: dict, block_hash: Optional[str] = None) -> None:
+        """
+        Durably append an already validated block to the block store together with
+        its hash, which is computed here once and never again. The block's NFT state
+        undo data is kept for the last REORG_MAX_DEPTH blocks.
+        """
+        block_hash = block_hash or self._hash(block)
+        self.chain.append(block, block_hash)
+        self.validated_height = len(self.chain)
+        self._undo[block_hash] = self.nft_state.apply_block(block)
+        while len(self._undo) > REORG_MAX_DEPTH:
+            self._undo.popitem(last=False)
+
+    def _compact_mempool_journal(self) -> None:
+        """
+        Rewrite the mempool journal so it only holds transactions that are still pending.
+        """
+        self.mempool_journal.rewrite(self._journal_record(tx) for tx in self.mempool)
+
+    def _journal_record(self, transaction: Transaction) -> dict:
+        return {"tx": transaction.to_dict(), "added_at": self.mempool.added_at(transaction.tx_id)}
+
+    def close(self) -> None:
+        """
+        Flush buffered mempool admissions and close the on-disk logs.
+        """
+        self.miner.shutdown()
+        self.validator.shutdown()
+        with self._lock:
+            self.mempool_journal.close()
+            self.chain.close()
+        print("Blockchain storage closed.")
 
     def load_from_file(self) -> bool:
         try:
-            with open(self.chain_file, 'r') as f:
-                data = _json.load(f)
-            self.chain = data['chain']
-            self.pending_transactions = [Transaction.from_dict(tx) for tx in data['pending_transactions']]
+            self.chain.open()
+            journal_records = self.mempool_journal.open()
+            self._replay_mempool_journal(journal_records)
+            if not self.chain:
+                self._migrate_legacy_files()
+            # Only validated blocks are ever written to the store
+            self.validated_height = len(self.chain)
+            self.nft_state.rebuild(self.chain)
+            if not self.chain:
+                print("Block store is empty, starting new blockchain.")
+                return False
             print("Blockchain loaded from file.")
             return True
-        except FileNotFoundError:
-            print("Blockchain file not found, starting new blockchain.")
-            return False
         except Exception as e:
             print(f"Error loading blockchain from file: {e}")
             return False
+
+    def _restore_mempool(self, tx_dicts) -> None:
+        self.mempool.clear()
+        for tx_data in tx_dicts:
+            self._restore_pending(Transaction.from_dict(tx_data))
+
+    def _replay_mempool_journal(self, records: List[dict]) -> None:
+        self.mempool.clear()
+        for record in records:
+            if "remove" in record:
+                self.mempool.remove([record["remove"]])
+            else:
+                self._restore_pending(Transaction.from_dict(record["tx"]), record.get("added_at"))
+
+    def _restore_pending(self, transaction: Transaction, added_at: Optional[float] = None) -> None:
+        try:
+            self.mempool.add(transaction, added_at=added_at)
+        except ValueError as e:
+            print(f"Dropping pending transaction on load: {e}")
+
+    def _migrate_legacy_files(self) -> None:
+        """
+        Import a chain saved by an older storage format into the block store.
+        """
+        if _os.path.exists(self.legacy_log_file):
+            legacy_log = BlockLog(self.legacy_log_file)
+            blocks = legacy_log.open()
+            legacy_log.close()
+            source = self.legacy_log_file
+        elif _os.path.exists(self.chain_file):
+            with open(self.chain_file, 'r') as f:
+                data = _json.load(f)
+            blocks = data['chain']
+            self._restore_mempool(data['pending_transactions'])
+            self._compact_mempool_journal()
+            source = self.chain_file
+        else:
+            return
+        block_hashes = self._validate_chain(blocks)
+        if block_hashes is None:
+            print(f"Chain in {source} is invalid, not migrating it.")
+            return
+        self.chain.extend(blocks, block_hashes)
+        print(f"Migrated {len(blocks)} blocks from {source} to the block store.")
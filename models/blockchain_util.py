@@ -32,6 +32,7 @@ class BlockModel(BaseModel):
     index: int
     timestamp: str
     transactions: List[TransactionModel]
+    merkle_root: Optional[str] = None  # Missing on blocks mined before Merkle roots
     proof: int
     previous_hash: str
 
@@ -39,6 +40,7 @@ class BlockModel(BaseModel):
 class BlockchainModel(BaseModel):
     chain: List[BlockModel]
     length: int
+    next_height: Optional[int] = None  # from_height of the next page, None once the tip is reached
 
 
 class MineBlockResponse(BaseModel):
@@ -60,6 +62,19 @@ class NodeRegisterModel(BaseModel):
     node_address: str
 
 
+class GossipMessageModel(BaseModel):
+    id: str
+    type: str  # "block", "compact_block", "transaction" or "node"
+    payload: dict
+    ttl: int  # Hops left before the message stops being relayed
+    origin: Optional[str] = None
+    sender: Optional[str] = None
+
+
+class GossipBatchModel(BaseModel):
+    messages: List[GossipMessageModel]
+
+
 class PostModel(BaseModel):
     id: int
     user_id: int
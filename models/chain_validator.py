@@ -0,0 +1,134 @@
+# chain_validator.py
+import os as _os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from models.miner import is_valid_proof
+
+
+def check_blocks(blocks: List[dict], previous_proof: Optional[int]) -> Tuple[List[str], Optional[str]]:
+    """
+    Hash a run of consecutive blocks and check each one's proof of work, Merkle root
+    and that its transactions are distinct. `previous_proof` is the proof of the
+    block before the run, or None if the run starts at genesis. Returns the hashes of
+    the blocks that passed and, if one failed, why. Runs inside pool worker
+    processes, so it must stay a module-level function.
+    """
+    # Imported here because models.blockchain imports this module
+    from models.blockchain import block_hash, has_valid_merkle_root
+
+    block_hashes = []
+    for block in blocks:
+        if previous_proof is not None and not is_valid_proof(previous_proof, block["proof"], block["index"]):
+            return block_hashes, f"Invalid proof of work at block {block['index']}"
+        if block.get("merkle_root") and not has_valid_merkle_root(block):
+            return block_hashes, f"Invalid Merkle root or duplicate transaction at block {block['index']}"
+        block_hashes.append(block_hash(block))
+        previous_proof = block["proof"]
+    return block_hashes, None
+
+
+def _chunks(blocks: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    iterator = iter(blocks)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ChainValidator:
+    """
+    Validates runs of blocks, spreading the expensive work across a process pool.
+
+    Hashing a block and checking its proof of work and Merkle root only needs the
+    block itself and the previous block's proof, so chunks of `chunk_size` blocks are
+    checked in parallel, with a couple of chunks queued per worker. A cheap sequential
+    pass then checks that indexes and previous hashes link up. Runs that fit in one
+    chunk are checked in-process, where a pool would only add overhead.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 256) -> None:
+        self.workers = workers or _os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def validate(
+        self,
+        blocks: Iterable[dict],
+        previous_block: Optional[dict] = None,
+        previous_hash: Optional[str] = None,
+    ) -> Optional[List[str]]:
+        """
+        Validate `blocks` as consecutive blocks following `previous_block`, whose hash
+        is `previous_hash`, or as a chain starting at genesis if it is None.
+        Returns the block hashes, or None if a block is invalid.
+        """
+        chunks = _chunks(blocks, self.chunk_size)
+        first = next(chunks, None)
+        if first is None:
+            return []
+        second = next(chunks, None)
+        previous_proof = previous_block["proof"] if previous_block else None
+        if second is None or self.workers <= 1:
+            checked = self._check_in_process(first, second, chunks, previous_proof)
+        else:
+            checked = self._check_in_pool(first, second, chunks, previous_proof)
+
+        block_hashes: List[str] = []
+        previous_index = previous_block["index"] if previous_block else None
+        for chunk, (chunk_hashes, error) in checked:
+            for block, block_hash in zip(chunk, chunk_hashes):
+                if previous_index is not None and block["index"] != previous_index + 1:
+                    print(f"Invalid index at block {block['index']}")
+                    return None
+                if previous_hash is not None and block["previous_hash"] != previous_hash:
+                    print(f"Invalid previous hash at block {block['index']}")
+                    return None
+                block_hashes.append(block_hash)
+                previous_index, previous_hash = block["index"], block_hash
+            if error:
+                print(error)
+                return None
+        return block_hashes
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _check_in_process(self, first, second, chunks, previous_proof):
+        for chunk in self._chain_chunks(first, second, chunks):
+            result = check_blocks(chunk, previous_proof)
+            yield chunk, result
+            if result[1]:
+                return
+            previous_proof = chunk[-1]["proof"]
+
+    def _check_in_pool(self, first, second, chunks, previous_proof):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        in_flight = deque()
+        try:
+            for chunk in self._chain_chunks(first, second, chunks):
+                in_flight.append((chunk, self._pool.submit(check_blocks, chunk, previous_proof)))
+                previous_proof = chunk[-1]["proof"]
+                # Keep the pool busy while bounding the number of blocks held in memory
+                while len(in_flight) >= self.workers * 2:
+                    chunk_done, future = in_flight.popleft()
+                    yield chunk_done, future.result()
+            while in_flight:
+                chunk_done, future = in_flight.popleft()
+                yield chunk_done, future.result()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    @staticmethod
+    def _chain_chunks(first, second, chunks):
+        yield first
+        if second is not None:
+            yield second
+            yield from chunks
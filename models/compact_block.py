@@ -0,0 +1,56 @@
+# compact_block.py
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Short transaction ids are the first 8 bytes of the transaction id. A collision can
+# only make reconstruction fail the Merkle root check, never accept a wrong block.
+SHORT_ID_LENGTH = 16  # hex characters
+
+
+def short_transaction_id(tx_id: str) -> str:
+    return tx_id[:SHORT_ID_LENGTH]
+
+
+def to_compact_block(block: dict, header: dict, tx_ids: List[str]) -> dict:
+    """
+    Compact form of `block`: its header and a short id per transaction. Miner reward
+    transactions can never be in a peer's mempool, so they are sent in full.
+    """
+    prefilled = [
+        {"position": position, "transaction": tx}
+        for position, tx in enumerate(block["transactions"])
+        if tx["sender"] == "SYSTEM" and not tx.get("nft")
+    ]
+    return {
+        "header": header,
+        "short_ids": [short_transaction_id(tx_id) for tx_id in tx_ids],
+        "prefilled": prefilled,
+    }
+
+
+def reconstruct_transactions(
+    compact: dict, lookup: Callable[[str], Optional[dict]]
+) -> Tuple[List[Optional[dict]], List[int]]:
+    """
+    Fill in the transactions of a compact block from `lookup`, which maps a short id
+    to a known transaction. Returns the transactions, with None for every position
+    that could not be filled, and the list of those missing positions.
+    """
+    transactions: List[Optional[dict]] = [None] * len(compact["short_ids"])
+    for entry in compact["prefilled"]:
+        transactions[entry["position"]] = entry["transaction"]
+    missing = []
+    for position, short_id in enumerate(compact["short_ids"]):
+        if transactions[position] is None:
+            transactions[position] = lookup(short_id)
+            if transactions[position] is None:
+                missing.append(position)
+    return transactions, missing
+
+
+def index_by_short_id(transactions: Iterable[Tuple[str, T]]) -> Dict[str, T]:
+    """
+    Map the short ids of (transaction id, transaction) pairs to the transactions.
+    """
+    return {short_transaction_id(tx_id): tx for tx_id, tx in transactions}
@@ -0,0 +1,172 @@
+# hash_index.py
+import mmap as _mmap
+import os as _os
+import struct as _struct
+from typing import Iterable, Optional, Tuple
+
+# File layout: a header followed by `capacity` fixed-size slots.
+# Header: <magic:8 bytes><capacity:uint64><live entries:uint64><used slots:uint64><covered height:uint64>
+# Slot:   <block hash:32 bytes><height:uint64>, height 0 marks an empty slot
+HEADER = _struct.Struct("<8sQQQQ")
+SLOT = _struct.Struct("<32sQ")
+MAGIC = b"HASHIDX1"
+TOMBSTONE = 2**64 - 1
+MIN_CAPACITY = 1024
+
+
+class HashIndex:
+    """
+    Persistent block hash -> height index.
+
+    An open-addressing hash table stored in a memory-mapped file, so it is available
+    immediately at startup and lookups cost O(1) regardless of chain height. Keys are
+    SHA-256 digests, which are already uniformly distributed, so their first 8 bytes are
+    used directly as the probe start.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+        self._map: Optional[_mmap.mmap] = None
+        self.capacity = 0
+        self.count = 0
+        self.used = 0
+        self.height = 0  # Chain height the index is known to cover
+
+    def open(self) -> None:
+        if not _os.path.exists(self.path) or _os.path.getsize(self.path) < HEADER.size:
+            self._create(self.path, MIN_CAPACITY)
+        self._file = open(self.path, "r+b")
+        self._map = _mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.count, self.used, self.height = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) != HEADER.size + self.capacity * SLOT.size:
+            print(f"{self.path} is corrupt, it will be rebuilt.")
+            self.clear()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._write_header()
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def get(self, block_hash: str) -> Optional[int]:
+        """
+        Return the height of the block with `block_hash`, or None if it is unknown.
+        """
+        key = bytes.fromhex(block_hash)
+        slot, found = self._find(key)
+        if not found:
+            return None
+        return SLOT.unpack_from(self._map, self._slot_offset(slot))[1]
+
+    def put(self, block_hash: str, height: int) -> None:
+        if (self.used + 1) * 2 > self.capacity:
+            self._resize(self.capacity * 2)
+        key = bytes.fromhex(block_hash)
+        slot, found = self._find(key)
+        if not found:
+            _, existing = SLOT.unpack_from(self._map, self._slot_offset(slot))
+            self.count += 1
+            if existing != TOMBSTONE:
+                self.used += 1
+        SLOT.pack_into(self._map, self._slot_offset(slot), key, height)
+
+    def remove(self, block_hash: str) -> None:
+        key = bytes.fromhex(block_hash)
+        slot, found = self._find(key)
+        if found:
+            SLOT.pack_into(self._map, self._slot_offset(slot), key, TOMBSTONE)
+            self.count -= 1
+
+    def set_height(self, height: int) -> None:
+        """
+        Record the chain height covered by the index and flush it to disk.
+        """
+        self.height = height
+        self._write_header()
+        self._map.flush()
+
+    def clear(self) -> None:
+        self.height = 0
+        self._rebuild(MIN_CAPACITY, ())
+
+    def rebuild(self, entries: Iterable[Tuple[str, int]]) -> None:
+        entries = list(entries)
+        capacity = MIN_CAPACITY
+        while len(entries) * 2 >= capacity:
+            capacity *= 2
+        self._rebuild(capacity, ((bytes.fromhex(h), height) for h, height in entries))
+
+    def _find(self, key: bytes) -> Tuple[int, bool]:
+        """
+        Probe for `key`. Returns (slot, True) if present, otherwise (slot to insert into, False).
+        """
+        mask = self.capacity - 1
+        slot = int.from_bytes(key[:8], "little") & mask
+        first_free = None
+        while True:
+            stored_key, height = SLOT.unpack_from(self._map, self._slot_offset(slot))
+            if height == 0:
+                return (first_free if first_free is not None else slot), False
+            if height == TOMBSTONE:
+                if first_free is None:
+                    first_free = slot
+            elif stored_key == key:
+                return slot, True
+            slot = (slot + 1) & mask
+
+    def _slot_offset(self, slot: int) -> int:
+        return HEADER.size + slot * SLOT.size
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(self._map, 0, MAGIC, self.capacity, self.count, self.used, self.height)
+
+    def _live_entries(self):
+        for slot in range(self.capacity):
+            key, height = SLOT.unpack_from(self._map, self._slot_offset(slot))
+            if height not in (0, TOMBSTONE):
+                yield key, height
+
+    def _resize(self, capacity: int) -> None:
+        while self.count * 2 >= capacity:
+            capacity *= 2
+        self._rebuild(capacity, list(self._live_entries()))
+
+    def _rebuild(self, capacity: int, entries) -> None:
+        """
+        Write a fresh table with `entries` to a temporary file and swap it in atomically.
+        """
+        tmp_path = f"{self.path}.tmp"
+        self._create(tmp_path, capacity)
+        with open(tmp_path, "r+b") as f:
+            mapped = _mmap.mmap(f.fileno(), 0)
+            count = 0
+            for key, height in entries:
+                slot = int.from_bytes(key[:8], "little") & (capacity - 1)
+                while SLOT.unpack_from(mapped, HEADER.size + slot * SLOT.size)[1] != 0:
+                    slot = (slot + 1) & (capacity - 1)
+                SLOT.pack_into(mapped, HEADER.size + slot * SLOT.size, key, height)
+                count += 1
+            HEADER.pack_into(mapped, 0, MAGIC, capacity, count, count, self.height)
+            mapped.flush()
+            mapped.close()
+            _os.fsync(f.fileno())
+
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        _os.replace(tmp_path, self.path)
+        self._file = open(self.path, "r+b")
+        self._map = _mmap.mmap(self._file.fileno(), 0)
+        self.capacity, self.count, self.used = capacity, count, count
+
+    @staticmethod
+    def _create(path: str, capacity: int) -> None:
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, capacity, 0, 0, 0))
+            f.truncate(HEADER.size + capacity * SLOT.size)
@@ -0,0 +1,264 @@
+# mempool.py
+import heapq as _heapq
+import itertools as _itertools
+import time as _time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from models.blockchain import Transaction
+
+
+class DuplicateTransactionError(ValueError):
+    """
+    Raised when a transaction that is already pending is submitted again.
+    """
+
+
+class ConflictingTransactionError(ValueError):
+    """
+    Raised when a transaction transfers an NFT that already has a pending transfer.
+    """
+
+
+class MempoolFullError(ValueError):
+    """
+    Raised when the mempool is full and the transaction does not pay more than
+    the cheapest pending transaction it would have to evict.
+    """
+
+
+# How to handle a second pending transfer of the same NFT
+CONFLICT_FIRST_SEEN = "first-seen"  # Keep the first transfer, reject the newcomer
+CONFLICT_REPLACE_BY_PRICE = "replace-by-price"  # Keep whichever transfer pays more
+CONFLICT_POLICIES = (CONFLICT_FIRST_SEEN, CONFLICT_REPLACE_BY_PRICE)
+
+
+class Mempool:
+    """
+    Pending transactions in arrival order, keyed by transaction id.
+    Admission, duplicate detection and removal of a mined transaction are all O(1).
+
+    A DNA -> pending transaction index makes sure at most one transfer of each NFT
+    is pending, so conflicting transfers are caught at admission time.
+
+    The pool is bounded by `max_transactions` and `max_bytes` of canonical transaction
+    JSON. When full, the cheapest (and among equals, the newest) pending transactions
+    are evicted for a better paying newcomer, using a min-heap on price. Transactions
+    older than `ttl` seconds expire; since entries are kept in arrival order, expiry
+    only ever looks at the oldest ones. Transactions larger than `max_transaction_bytes`
+    could never be mined and are rejected outright.
+    """
+
+    def __init__(
+        self,
+        conflict_policy: str = CONFLICT_FIRST_SEEN,
+        max_transactions: int = 50_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3 * 60 * 60,
+        max_transaction_bytes: Optional[int] = None,
+    ) -> None:
+        if conflict_policy not in CONFLICT_POLICIES:
+            raise ValueError(
+                f"Unknown conflict policy '{conflict_policy}'. Use one of: {', '.join(CONFLICT_POLICIES)}"
+            )
+        self.conflict_policy = conflict_policy
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_transaction_bytes = max_transaction_bytes
+        self.total_bytes = 0
+        self._transactions: "OrderedDict[str, Transaction]" = OrderedDict()
+        self._by_dna: Dict[str, str] = {}
+        self._added_at: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._sequence: Dict[str, int] = {}
+        self._counter = _itertools.count()
+        # Min-heap of (price, -sequence, tx_id); entries of removed transactions are
+        # skipped lazily and the heap is rebuilt once they dominate it
+        self._eviction_heap: list = []
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def __iter__(self) -> Iterator["Transaction"]:
+        return iter(list(self._transactions.values()))
+
+    def __contains__(self, tx_id: str) -> bool:
+        return tx_id in self._transactions
+
+    def items(self) -> Iterator[Tuple[str, "Transaction"]]:
+        return iter(list(self._transactions.items()))
+
+    def get(self, tx_id: str) -> Optional["Transaction"]:
+        return self._transactions.get(tx_id)
+
+    def added_at(self, tx_id: str) -> Optional[float]:
+        return self._added_at.get(tx_id)
+
+    def oldest_added_at(self) -> Optional[float]:
+        for tx_id in self._transactions:
+            return self._added_at[tx_id]
+        return None
+
+    def pending_for_dna(self, dna: str) -> Optional["Transaction"]:
+        tx_id = self._by_dna.get(dna)
+        return self._transactions[tx_id] if tx_id else None
+
+    def add(self, transaction: "Transaction", added_at: Optional[float] = None) -> List["Transaction"]:
+        """
+        Admit a transaction. Returns every pending transaction that was dropped to make
+        room for it: a replaced conflicting transfer, expired and evicted transactions.
+        """
+        now = _time.time()
+        added_at = added_at if added_at is not None else now
+        dropped = self.expire(now)
+        if added_at + self.ttl <= now:
+            raise ValueError("Transaction expired before it could be admitted.")
+
+        tx_id = transaction.tx_id
+        if tx_id in self._transactions:
+            raise DuplicateTransactionError(f"Transaction {tx_id} is already pending.")
+        size = len(transaction.canonical_bytes())
+        if self.max_transaction_bytes is not None and size > self.max_transaction_bytes:
+            raise ValueError(f"Transaction of {size} bytes would not fit in a block.")
+        if size > self.max_bytes:
+            raise MempoolFullError(f"Transaction of {size} bytes exceeds the mempool size limit.")
+
+        dna = transaction.nft.dna if transaction.nft else None
+        conflicting_id = self._by_dna.get(dna) if dna else None
+        if conflicting_id:
+            conflicting = self._transactions[conflicting_id]
+            if self.conflict_policy == CONFLICT_FIRST_SEEN or transaction.price <= conflicting.price:
+                raise ConflictingTransactionError(
+                    f"NFT {dna} already has a pending transfer ({conflicting_id})."
+                )
+
+        victims = self._select_victims(transaction.price, size, conflicting_id)
+        if conflicting_id:
+            dropped += self.remove([conflicting_id])
+        dropped += self.remove(victims)
+
+        sequence = next(self._counter)
+        self._transactions[tx_id] = transaction
+        self._added_at[tx_id] = added_at
+        self._sizes[tx_id] = size
+        self._sequence[tx_id] = sequence
+        self.total_bytes += size
+        _heapq.heappush(self._eviction_heap, (transaction.price, -sequence, tx_id))
+        if dna:
+            self._by_dna[dna] = tx_id
+        return dropped
+
+    def select_for_block(self, max_transactions: int, max_bytes: int) -> List["Transaction"]:
+        """
+        Pick transactions for a block template: highest price first, earliest arrival
+        among equal prices, stopping at `max_transactions` and skipping any transaction
+        that would push the template past `max_bytes`.
+        """
+        candidates = sorted(
+            self._transactions.items(),
+            key=lambda item: (-item[1].price, self._sequence[item[0]]),
+        )
+        selected = []
+        used_bytes = 0
+        for tx_id, transaction in candidates:
+            if len(selected) >= max_transactions:
+                break
+            size = self._sizes[tx_id]
+            if used_bytes + size > max_bytes:
+                continue
+            selected.append(transaction)
+            used_bytes += size
+        return selected
+
+    def expire(self, now: Optional[float] = None) -> List["Transaction"]:
+        """
+        Drop transactions that have been pending for longer than the TTL.
+        """
+        now = now if now is not None else _time.time()
+        expired = []
+        for tx_id in self._transactions:
+            if self._added_at[tx_id] + self.ttl > now:
+                break
+            expired.append(tx_id)
+        return self.remove(expired)
+
+    def remove(self, tx_ids: Iterable[str]) -> List["Transaction"]:
+        """
+        Remove the given transactions if pending and return the ones that were removed.
+        """
+        removed = []
+        for tx_id in tx_ids:
+            transaction = self._transactions.pop(tx_id, None)
+            if transaction is not None:
+                if transaction.nft and self._by_dna.get(transaction.nft.dna) == tx_id:
+                    del self._by_dna[transaction.nft.dna]
+                del self._added_at[tx_id]
+                del self._sequence[tx_id]
+                self.total_bytes -= self._sizes.pop(tx_id)
+                removed.append(transaction)
+        if len(self._eviction_heap) > 2 * len(self._transactions) + 1024:
+            self._rebuild_eviction_heap()
+        return removed
+
+    def clear(self) -> None:
+        self._transactions.clear()
+        self._by_dna.clear()
+        self._added_at.clear()
+        self._sizes.clear()
+        self._sequence.clear()
+        self._eviction_heap = []
+        self.total_bytes = 0
+
+    def _select_victims(self, price: float, size: int, replaced_id: Optional[str]) -> List[str]:
+        """
+        Pick the cheapest pending transactions to evict so that a transaction of `size`
+        bytes paying `price` fits. Raises MempoolFullError if that would mean evicting
+        something that pays at least as much.
+        """
+        count = len(self._transactions) + 1
+        total_bytes = self.total_bytes + size
+        if replaced_id:
+            count -= 1
+            total_bytes -= self._sizes[replaced_id]
+
+        victims = []
+        popped = []
+        while count > self.max_transactions or total_bytes > self.max_bytes:
+            entry = self._pop_live_entry(skip=replaced_id)
+            if entry is None or entry[0] >= price:
+                if entry is not None:
+                    popped.append(entry)
+                for restored in popped:
+                    _heapq.heappush(self._eviction_heap, restored)
+                raise MempoolFullError("Mempool is full and the transaction price is too low.")
+            popped.append(entry)
+            victims.append(entry[2])
+            count -= 1
+            total_bytes -= self._sizes[entry[2]]
+        return victims
+
+    def _pop_live_entry(self, skip: Optional[str]):
+        skipped = None
+        while self._eviction_heap:
+            entry = _heapq.heappop(self._eviction_heap)
+            _, negative_sequence, tx_id = entry
+            if self._sequence.get(tx_id) != -negative_sequence:
+                continue  # Stale entry of a removed transaction
+            if tx_id == skip:
+                skipped = entry
+                continue
+            if skipped is not None:
+                _heapq.heappush(self._eviction_heap, skipped)
+            return entry
+        if skipped is not None:
+            _heapq.heappush(self._eviction_heap, skipped)
+        return None
+
+    def _rebuild_eviction_heap(self) -> None:
+        self._eviction_heap = [
+            (transaction.price, -self._sequence[tx_id], tx_id)
+            for tx_id, transaction in self._transactions.items()
+        ]
+        _heapq.heapify(self._eviction_heap)
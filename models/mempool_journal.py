@@ -0,0 +1,126 @@
+# mempool_journal.py
+import os as _os
+import threading as _threading
+from typing import Iterable, List
+
+from models.block_log import BlockLog, encode_frame
+
+DURABILITY_NONE = "none"
+DURABILITY_BATCHED = "batched"
+DURABILITY_PER_TX = "per-tx"
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_BATCHED, DURABILITY_PER_TX)
+
+
+class MempoolJournal(BlockLog):
+    """
+    Append-only journal of pending transactions.
+
+    Durability modes:
+    - "none": every frame is flushed to the OS page cache as it is written but never
+      fsynced, so it survives a crash of the process but not of the machine.
+    - "batched": frames are buffered and written with one fsync per group commit,
+      triggered by `batch_size` pending frames or `batch_interval` seconds.
+    - "per-tx": every admission is written and fsynced before it is acknowledged.
+
+    `close()` always flushes, so acknowledged transactions survive a clean shutdown.
+
+    `_lock` only guards the buffer, so admissions never wait on the disk. File writes
+    and fsyncs are serialized by `_io_lock`, which is always taken before `_lock`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        durability: str = DURABILITY_BATCHED,
+        batch_size: int = 256,
+        batch_interval: float = 0.05,
+    ) -> None:
+        if durability not in DURABILITY_MODES:
+            raise ValueError(
+                f"Unknown durability mode '{durability}'. Use one of: {', '.join(DURABILITY_MODES)}"
+            )
+        super().__init__(path)
+        self.durability = durability
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._buffer: List[bytes] = []
+        self._lock = _threading.Lock()
+        self._io_lock = _threading.Lock()
+        self._wakeup = _threading.Condition(self._lock)
+        self._flusher = None
+        self._closed = False
+
+    def open(self) -> List[dict]:
+        records = super().open()
+        if self.durability == DURABILITY_BATCHED and self._flusher is None:
+            self._closed = False
+            self._flusher = _threading.Thread(
+                target=self._flush_loop, name="mempool-journal-flusher", daemon=True
+            )
+            self._flusher.start()
+        return records
+
+    def append(self, record: dict) -> None:
+        frame = encode_frame(record)
+        if self.durability == DURABILITY_BATCHED:
+            with self._lock:
+                self._buffer.append(frame)
+                if len(self._buffer) >= self.batch_size:
+                    self._wakeup.notify()
+            return
+        with self._io_lock:
+            self._file.write(frame)
+            self._file.flush()
+            if self.durability == DURABILITY_PER_TX:
+                _os.fsync(self._file.fileno())
+
+    def flush(self) -> None:
+        """
+        Write every buffered frame and fsync them as one group commit.
+        """
+        with self._io_lock:
+            self._write_buffered()
+
+    def rewrite(self, records: Iterable[dict]) -> None:
+        """
+        Compact the journal down to `records`, the transactions still pending.
+        Buffered frames are dropped because `records` supersedes them.
+        """
+        with self._io_lock:
+            with self._lock:
+                self._buffer = []
+            super().rewrite(records)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._io_lock:
+            if self._file is not None:
+                self._write_buffered()
+            self._close_file()
+
+    def _write_buffered(self) -> None:
+        # Called with _io_lock held; the buffer is swapped out so appends can carry on
+        with self._lock:
+            frames, self._buffer = self._buffer, []
+        if frames:
+            self._file.write(b"".join(frames))
+        if self.durability != DURABILITY_NONE:
+            self._file.flush()
+            _os.fsync(self._file.fileno())
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(self.batch_interval)
+                if self._closed:
+                    return  # close() writes whatever is left
+                if not self._buffer:
+                    continue
+            with self._io_lock:
+                self._write_buffered()
@@ -0,0 +1,53 @@
+# merkle.py
+import hashlib as _hashlib
+from typing import List
+
+# Leaves are transaction ids (hex SHA-256 digests). An odd node at any level is
+# paired with itself. The root of an empty tree is the hash of no data.
+EMPTY_ROOT = _hashlib.sha256(b"").hexdigest()
+
+
+def _hash_pair(left: str, right: str) -> str:
+    return _hashlib.sha256(bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _next_level(level: List[str]) -> List[str]:
+    if len(level) % 2:
+        level = level + [level[-1]]
+    return [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+
+def merkle_root(leaves: List[str]) -> str:
+    if not leaves:
+        return EMPTY_ROOT
+    level = list(leaves)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+
+def merkle_proof(leaves: List[str], position: int) -> List[dict]:
+    """
+    Return the sibling path proving that leaves[position] is part of the tree.
+    Each step names the sibling hash and which side of the pair it sits on.
+    """
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = position ^ 1
+        proof.append({"hash": level[sibling], "position": "left" if sibling < position else "right"})
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf: str, proof: List[dict], root: str) -> bool:
+    current = leaf
+    for step in proof:
+        if step["position"] == "left":
+            current = _hash_pair(step["hash"], current)
+        else:
+            current = _hash_pair(current, step["hash"])
+    return current == root
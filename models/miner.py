@@ -0,0 +1,152 @@
+# miner.py
+import hashlib as _hashlib
+import os as _os
+import threading as _threading
+import time as _time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Optional
+
+# A proof is valid when the SHA-256 hex digest starts with "0000", i.e. the raw
+# digest starts with two zero bytes. Comparing bytes avoids hexdigest() and slicing.
+DIFFICULTY_PREFIX = b"\x00\x00"
+# Expected number of hashes to find a proof, i.e. the work each block represents
+BLOCK_WORK = 2 ** (8 * len(DIFFICULTY_PREFIX))
+
+
+def is_valid_proof(previous_proof: int, proof: int, index: int) -> bool:
+    to_digest = str(proof**2 - previous_proof**2 + index).encode()
+    return _hashlib.sha256(to_digest).digest()[:2] == DIFFICULTY_PREFIX
+
+
+def search_nonces(previous_proof: int, index: int, start: int, stop: int) -> Optional[int]:
+    """
+    Return the first valid proof in [start, stop), or None.
+    Runs inside pool worker processes, so it must stay a module-level function.
+    """
+    offset = index - previous_proof * previous_proof
+    sha256 = _hashlib.sha256
+    prefix = DIFFICULTY_PREFIX
+    for proof in range(start, stop):
+        if sha256(str(proof * proof + offset).encode()).digest()[:2] == prefix:
+            return proof
+    return None
+
+
+class MiningCancelled(Exception):
+    """
+    Raised when a proof-of-work search is abandoned, e.g. because a competing
+    block was accepted at the same height.
+    """
+
+
+class _MiningJob:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.cancelled = _threading.Event()
+        self.hashes = 0  # Hashes computed so far, also counted when the search is cancelled
+
+
+class ProofOfWorkMiner:
+    """
+    Proof-of-work search split across a process pool.
+
+    The nonce space is handed out in chunks of `chunk_size`, with a couple of chunks
+    queued per worker. Cancellation is checked between chunks, so an abandoned search
+    stops within roughly one chunk's worth of hashing.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 50_000) -> None:
+        self.workers = workers or _os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: List[_MiningJob] = []
+        self._lock = _threading.Lock()
+        self._total_hashes = 0
+        self._total_seconds = 0.0
+        self._last_hashes_per_second = 0.0
+
+    def mine(self, previous_proof: int, index: int) -> int:
+        job = _MiningJob(index)
+        with self._lock:
+            self._jobs.append(job)
+        started = _time.monotonic()
+        try:
+            if self.workers <= 1:
+                return self._mine_in_thread(job, previous_proof)
+            return self._mine_in_pool(job, previous_proof)
+        finally:
+            elapsed = _time.monotonic() - started
+            hashes = job.hashes
+            with self._lock:
+                self._jobs.remove(job)
+                self._total_hashes += hashes
+                self._total_seconds += elapsed
+                if elapsed > 0:
+                    self._last_hashes_per_second = hashes / elapsed
+
+    def cancel(self, index: Optional[int] = None) -> int:
+        """
+        Cancel running searches for block `index`, or all searches if index is None.
+        Returns the number of searches cancelled.
+        """
+        with self._lock:
+            jobs = [job for job in self._jobs if index is None or job.index == index]
+        for job in jobs:
+            job.cancelled.set()
+        return len(jobs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active_jobs": len(self._jobs),
+                "total_hashes": self._total_hashes,
+                "last_hashes_per_second": round(self._last_hashes_per_second, 2),
+                "average_hashes_per_second": round(
+                    self._total_hashes / self._total_seconds if self._total_seconds else 0.0, 2
+                ),
+            }
+
+    def shutdown(self) -> None:
+        self.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _mine_in_thread(self, job: _MiningJob, previous_proof: int):
+        start = 1
+        while not job.cancelled.is_set():
+            proof = search_nonces(previous_proof, job.index, start, start + self.chunk_size)
+            if proof is not None:
+                job.hashes = proof
+                return proof
+            start += self.chunk_size
+            job.hashes = start - 1
+        raise MiningCancelled(f"Mining of block {job.index} was cancelled.")
+
+    def _mine_in_pool(self, job: _MiningJob, previous_proof: int):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        in_flight = {}
+        next_start = 1
+        try:
+            while not job.cancelled.is_set():
+                while len(in_flight) < self.workers * 2:
+                    future = self._pool.submit(
+                        search_nonces, previous_proof, job.index, next_start, next_start + self.chunk_size
+                    )
+                    in_flight[future] = next_start
+                    next_start += self.chunk_size
+
+                done, _ = wait(in_flight, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = in_flight.pop(future)
+                    proof = future.result()
+                    if proof is not None:
+                        job.hashes += proof - start + 1
+                        return proof
+                    job.hashes += self.chunk_size
+            raise MiningCancelled(f"Mining of block {job.index} was cancelled.")
+        finally:
+            for future in in_flight:
+                future.cancel()
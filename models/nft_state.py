@@ -0,0 +1,66 @@
+# nft_state.py
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+
+class NFTStateIndex:
+    """
+    World state of every NFT on the chain, keyed by DNA.
+
+    Each entry holds the NFT metadata, current owner, last price and the index of
+    the block with the latest transfer. It is updated block by block as the chain
+    grows, so ownership checks and NFT reads are O(1). Applying a block returns undo
+    data, so a block can be disconnected again without replaying the chain.
+    """
+
+    def __init__(self) -> None:
+        self._nfts: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._nfts)
+
+    def __contains__(self, dna: str) -> bool:
+        return dna in self._nfts
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        return iter(list(self._nfts.items()))
+
+    def get(self, dna: str) -> Optional[dict]:
+        return self._nfts.get(dna)
+
+    def owner_of(self, dna: str) -> Optional[str]:
+        state = self._nfts.get(dna)
+        return state["owner"] if state else None
+
+    def apply_block(self, block: dict) -> Dict[str, Optional[dict]]:
+        """
+        Apply the transfers in `block`. Returns its undo data: the entry each NFT the
+        block touched had before, or None if the block created it.
+        """
+        undo: Dict[str, Optional[dict]] = {}
+        for tx in block["transactions"]:
+            nft_data = tx.get("nft")
+            if nft_data and nft_data.get("dna"):
+                if nft_data["dna"] not in undo:
+                    undo[nft_data["dna"]] = self._nfts.get(nft_data["dna"])
+                self._nfts[nft_data["dna"]] = {
+                    "nft": nft_data,
+                    "owner": tx["receiver"],
+                    "price": tx.get("price"),
+                    "last_block_index": block["index"],
+                }
+        return undo
+
+    def undo_block(self, undo: Dict[str, Optional[dict]]) -> None:
+        """
+        Revert a block given the undo data returned when it was applied.
+        """
+        for dna, previous in undo.items():
+            if previous is None:
+                self._nfts.pop(dna, None)
+            else:
+                self._nfts[dna] = previous
+
+    def rebuild(self, blocks: Iterable[dict]) -> None:
+        self._nfts = {}
+        for block in blocks:
+            self.apply_block(block)
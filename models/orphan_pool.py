@@ -0,0 +1,89 @@
+# orphan_pool.py
+import time as _time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class OrphanPool:
+    """
+    Blocks whose parent is not on our chain yet, keyed by block hash, with a
+    previous hash -> children map so they connect as soon as the parent arrives.
+
+    The pool holds at most `max_orphans` blocks for at most `max_age` seconds;
+    the oldest orphans are evicted first.
+    """
+
+    def __init__(self, max_orphans: int = 100, max_age: float = 600.0) -> None:
+        self.max_orphans = max_orphans
+        self.max_age = max_age
+        self._orphans: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._children: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._orphans)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self._orphans
+
+    def add(self, block: dict, block_hash: str) -> bool:
+        """
+        Hold `block` until its parent arrives. Returns False if it was already held.
+        """
+        self.expire()
+        if block_hash in self._orphans:
+            return False
+        self._orphans[block_hash] = (block, _time.time())
+        self._children.setdefault(block["previous_hash"], set()).add(block_hash)
+        while len(self._orphans) > self.max_orphans:
+            self._remove(next(iter(self._orphans)))
+        return True
+
+    def has_children(self, parent_hash: str) -> bool:
+        return parent_hash in self._children
+
+    def pop_children(self, parent_hash: str) -> List[Tuple[dict, str]]:
+        """
+        Remove and return the orphans whose parent is `parent_hash`, oldest first.
+        """
+        child_hashes = self._children.pop(parent_hash, set())
+        children = [
+            (self._orphans[child_hash][0], child_hash)
+            for child_hash in self._orphans
+            if child_hash in child_hashes
+        ]
+        for _, child_hash in children:
+            del self._orphans[child_hash]
+        return children
+
+    def missing_ancestor(self, block_hash: str) -> Optional[str]:
+        """
+        Follow `block_hash` back through the pool and return the hash of the first
+        ancestor that is not held, i.e. the block that has to be fetched next.
+        """
+        if block_hash not in self._orphans:
+            return None
+        while block_hash in self._orphans:
+            block_hash = self._orphans[block_hash][0]["previous_hash"]
+        return block_hash
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Evict orphans older than `max_age`. Returns the number evicted.
+        """
+        now = now if now is not None else _time.time()
+        expired = []
+        for block_hash, (_, received_at) in self._orphans.items():
+            if received_at + self.max_age > now:
+                break  # Orphans are kept in arrival order
+            expired.append(block_hash)
+        for block_hash in expired:
+            self._remove(block_hash)
+        return len(expired)
+
+    def _remove(self, block_hash: str) -> None:
+        block, _ = self._orphans.pop(block_hash)
+        siblings = self._children.get(block["previous_hash"])
+        if siblings is not None:
+            siblings.discard(block_hash)
+            if not siblings:
+                del self._children[block["previous_hash"]]
@@ -0,0 +1,62 @@
+# side_chains.py
+from typing import Dict, List, Optional, Tuple
+
+
+class SideChains:
+    """
+    Valid blocks that are not on the main chain, keyed by hash, each with the
+    cumulative work of the chain it ends. Blocks disconnected by a reorg move here,
+    so the node can switch back if their branch overtakes again.
+    """
+
+    def __init__(self) -> None:
+        self._blocks: Dict[str, Tuple[dict, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self._blocks
+
+    def add(self, block: dict, block_hash: str, work: int) -> None:
+        self._blocks[block_hash] = (block, work)
+
+    def get(self, block_hash: str) -> Optional[Tuple[dict, int]]:
+        return self._blocks.get(block_hash)
+
+    def remove(self, block_hash: str) -> None:
+        self._blocks.pop(block_hash, None)
+
+    def branch(self, tip_hash: str) -> List[Tuple[dict, str]]:
+        """
+        Blocks from the first side block up to `tip_hash`, oldest first. The parent
+        of the first block is on the main chain.
+        """
+        branch = []
+        block_hash = tip_hash
+        while block_hash in self._blocks:
+            block = self._blocks[block_hash][0]
+            branch.append((block, block_hash))
+            block_hash = block["previous_hash"]
+        branch.reverse()
+        return branch
+
+    def prune(self, min_index: int) -> int:
+        """
+        Forget side blocks below `min_index`, too deep to reorganise to, and every
+        block built on them, which could no longer connect to the main chain.
+        Returns the number of blocks dropped.
+        """
+        stale = [block_hash for block_hash, (block, _) in self._blocks.items() if block["index"] < min_index]
+        if not stale:
+            return 0
+        children: Dict[str, List[str]] = {}
+        for block_hash, (block, _) in self._blocks.items():
+            children.setdefault(block["previous_hash"], []).append(block_hash)
+        dropped = 0
+        while stale:
+            block_hash = stale.pop()
+            if self._blocks.pop(block_hash, None) is not None:
+                dropped += 1
+                stale.extend(children.get(block_hash, ()))
+        return dropped
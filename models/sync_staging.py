@@ -0,0 +1,68 @@
+# sync_staging.py
+import os as _os
+import tempfile as _tempfile
+import threading as _threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Tuple
+
+from models.block_log import BlockLog
+
+
+class SyncStaging:
+    """
+    Temporary on-disk staging of validated blocks downloaded during a chain sync,
+    held until the downloaded branch carries more work than our chain.
+
+    Worker threads use the staging through `use()`. A sync cancelled on the event
+    loop calls `close()`, which never waits for a worker: if one still holds the
+    staging, that worker removes the file once it is done with it.
+    """
+
+    def __init__(self, directory: str = ".") -> None:
+        fd, self.path = _tempfile.mkstemp(prefix="sync-", suffix=".staging", dir=directory)
+        _os.close(fd)
+        self.log = BlockLog(self.path)
+        self.count = 0  # Blocks staged
+        self.connected = False  # Whether the downloaded branch is our main chain yet
+        self._lock = _threading.Lock()
+        self._closed = False
+        self._discarded = False
+
+    @contextmanager
+    def use(self) -> Iterator[bool]:
+        """
+        Hold the staging from a worker thread. Yields False if the sync was abandoned.
+        """
+        try:
+            with self._lock:
+                yield not self._closed
+        finally:
+            if self._closed:
+                self._discard()
+
+    def extend(self, blocks: Iterable[Tuple[dict, str]]) -> None:
+        records = [{"hash": block_hash, "block": block} for block, block_hash in blocks]
+        self.log.extend(records)
+        self.count += len(records)
+
+    def blocks(self) -> Iterator[Tuple[dict, str]]:
+        """
+        The staged (block, hash) pairs, oldest first, read back one at a time.
+        """
+        for record in self.log.records():
+            yield record["block"], record["hash"]
+
+    def close(self) -> None:
+        self._closed = True
+        self._discard()
+
+    def _discard(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            return  # A worker holds the staging and discards it when done
+        try:
+            if not self._discarded:
+                self.log.close()
+                _os.remove(self.path)
+                self._discarded = True
+        finally:
+            self._lock.release()
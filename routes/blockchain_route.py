@@ -1,15 +1,35 @@
 # blockchain_route.py
+import asyncio
+import json
 import os
 from functools import lru_cache
 from typing import List, Optional
-import requests
 import boto3
+import httpx
 from botocore.exceptions import NoCredentialsError
 from database.connection import get_session
-from fastapi import APIRouter, HTTPException, Query, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, Depends, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlmodel import text, Session, select
 from dotenv import load_dotenv
-from models.blockchain import Blockchain, Transaction, NFT
+from models.blockchain import (
+    Blockchain,
+    Transaction,
+    NFT,
+    transaction_id,
+    block_hash,
+    SYNC_BLOCK_BATCH,
+    SYNC_HEADER_BATCH,
+    SYNC_TIMEOUT,
+    ORPHAN_FETCH_DEPTH,
+)
+from models.miner import MiningCancelled
+from utils.mining_scheduler import MiningScheduler
+from utils.block_cache import BlockResponseCache
+from utils.gossip import Gossip
+from utils.p2p_client import P2PClient
+from utils.tx_relay import TransactionRelay
 from models.blockchain_util import (
     MineBlockRequestModel,
     NFTModel,
@@ -18,6 +38,8 @@ from models.blockchain_util import (
     TransactionModel,
     BlockModel,
     BlockchainModel,
+    GossipBatchModel,
+    GossipMessageModel,
     MineBlockResponse,
     NFTWithOwnerAndPriceModel,
 )
@@ -28,6 +50,53 @@ load_dotenv()
 # Initialize the blockchain
 blockchain = Blockchain()
 
+# Shared, connection-pooled HTTP client for all requests to peer nodes,
+# with at most P2P_MAX_CONCURRENCY fan-out requests in flight
+P2P_MAX_CONNECTIONS = int(os.getenv("P2P_MAX_CONNECTIONS", 100))
+P2P_MAX_CONCURRENCY = int(os.getenv("P2P_MAX_CONCURRENCY", 32))
+p2p_client = P2PClient(
+    timeout=SYNC_TIMEOUT,
+    max_connections=P2P_MAX_CONNECTIONS,
+    max_concurrency=P2P_MAX_CONCURRENCY,
+)
+
+# Serialized block responses are cached up to BLOCK_CACHE_BYTES
+BLOCK_CACHE_BYTES = int(os.getenv("BLOCK_CACHE_BYTES", 32 * 1024 * 1024))
+block_cache = BlockResponseCache(max_bytes=BLOCK_CACHE_BYTES)
+
+# Address other nodes know this node by
+NODE_ADDRESS = f"http://{os.getenv('HOST', 'localhost')}:{os.getenv('PORT', '8000')}"
+
+# Gossip relay: peers each message is sent to per hop, hops before it stops
+# and how many message ids are remembered to drop repeats
+GOSSIP_FANOUT = int(os.getenv("GOSSIP_FANOUT", 4))
+GOSSIP_TTL = int(os.getenv("GOSSIP_TTL", 6))
+GOSSIP_SEEN_CACHE = int(os.getenv("GOSSIP_SEEN_CACHE", 100_000))
+# Transactions are relayed to each peer in batches of up to TX_RELAY_BATCH_SIZE,
+# sent at the latest TX_RELAY_INTERVAL seconds after being queued
+TX_RELAY_BATCH_SIZE = int(os.getenv("TX_RELAY_BATCH_SIZE", 256))
+TX_RELAY_INTERVAL = float(os.getenv("TX_RELAY_INTERVAL", 0.1))
+tx_relay = TransactionRelay(
+    p2p_client,
+    batch_size=TX_RELAY_BATCH_SIZE,
+    flush_interval=TX_RELAY_INTERVAL,
+)
+gossip = Gossip(
+    p2p_client,
+    peers=lambda: list(blockchain.nodes),
+    node_address=NODE_ADDRESS,
+    fanout=GOSSIP_FANOUT,
+    ttl=GOSSIP_TTL,
+    seen_capacity=GOSSIP_SEEN_CACHE,
+    tx_relay=tx_relay,
+)
+
+# Scheduled mining: mine once this many transactions are pending,
+# or once the oldest pending transaction has waited this many seconds
+MINER_ADDRESS = os.getenv("MINER_ADDRESS", "main server")
+MINING_MIN_TRANSACTIONS = int(os.getenv("MINING_MIN_TRANSACTIONS", 100))
+MINING_MAX_LATENCY = float(os.getenv("MINING_MAX_LATENCY", 60))
+
 # Initialize S3 client
 AWS_REGION = os.getenv("AWS_REGION")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -124,13 +193,7 @@ def get_current_owner(dna: str) -> Optional[str]:
     """
     Retrieve the current owner of the NFT based on its DNA.
     """
-    owner = None
-    for block in blockchain.chain:
-        for tx in block["transactions"]:
-            nft_data = tx.get("nft")
-            if nft_data and nft_data.get("dna") == dna:
-                owner = tx["receiver"]
-    return owner
+    return blockchain.nft_state.owner_of(dna)
 
 
 @router.post(
@@ -176,8 +239,7 @@ def create_transaction(transaction: TransactionModel):
             timestamp=transaction.timestamp,
         )
         index = blockchain.create_transaction(tx)
-        # Save blockchain after creating transaction
-        blockchain.save_to_file()
+        mining_scheduler.notify()
         return transaction
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -186,33 +248,19 @@ def create_transaction(transaction: TransactionModel):
 @router.post(
     "/broadcast_transaction",
 )
-def broadcast_transaction(transaction: TransactionModel):
+async def broadcast_transaction(transaction: TransactionModel):
     """
     Broadcast a transaction to other nodes in the network.
     """
     # Validate and create the transaction on the current node
     try:
-        create_transaction(transaction)  # Internal validation occurs here
+        await run_in_threadpool(create_transaction, transaction)  # Internal validation occurs here
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
-    # Broadcast the transaction to other nodes
-    broadcast_errors = []
-
-    for node in blockchain.nodes:
-        try:
-            # 일반적인 POST 요청 보내기
-            response = requests.post(
-                f"{node}/api/create_transaction",
-                json=transaction.dict(),
-                timeout=5,  # 타임아웃 설정 (선택 사항)
-            )
-            if response.status_code != 200:
-                broadcast_errors.append(
-                    f"Failed to broadcast to {node}: {response.text}"
-                )
-        except requests.exceptions.RequestException as e:
-            broadcast_errors.append(f"Failed to broadcast to {node}: {e}")
+    # Queue the transaction for batched gossip; this does not wait on any peer
+    errors = await gossip.publish("transaction", transaction.dict())
+    broadcast_errors = [f"Failed to broadcast to {node}: {error}" for node, error in errors.items()]
 
     if broadcast_errors:
         return {
@@ -223,13 +271,52 @@ def broadcast_transaction(transaction: TransactionModel):
     return {"message": "Transaction broadcasted successfully."}
 
 
+async def mine_and_broadcast_block(miner_address: str) -> BlockModel:
+    """
+    Mine a block from the pending transactions and send it to every known node.
+    Shared by /mine_block and the in-process mining scheduler.
+    """
+    # Proof of work runs in a worker thread, never on the event loop
+    block = await run_in_threadpool(blockchain.mine_block, miner_address)
+    # Convert block dict to BlockModel
+    block_model = BlockModel(
+        index=block["index"],
+        timestamp=block["timestamp"],
+        transactions=[
+            TransactionModel(
+                sender=tx["sender"],
+                receiver=tx["receiver"],
+                nft=NFTModel(**tx["nft"]) if tx.get("nft") else None,
+                price=tx["price"],
+                timestamp=tx["timestamp"],
+            )
+            for tx in block["transactions"]
+        ],
+        merkle_root=block.get("merkle_root"),
+        proof=block["proof"],
+        previous_hash=block["previous_hash"],
+    )
+    # Gossip the new block to the network in compact form
+    await gossip.publish("compact_block", blockchain.compact_block(block))
+    return block_model
+
+
+# In-process mining scheduler, started with the app
+mining_scheduler = MiningScheduler(
+    blockchain,
+    mine=lambda: mine_and_broadcast_block(MINER_ADDRESS),
+    min_transactions=MINING_MIN_TRANSACTIONS,
+    max_latency=MINING_MAX_LATENCY,
+)
+
+
 @router.post(
     "/mine_block",
     response_model=MineBlockResponse,
 )
-def mine_block(request: MineBlockRequestModel):
+async def mine_block(request: MineBlockRequestModel):
     """
-    Mine a new block by adding all pending transactions to the blockchain.
+    Mine a new block from the best-paying pending transactions that fit the block limits.
     """
     miner_address = request.miner_address
 
@@ -237,123 +324,187 @@ def mine_block(request: MineBlockRequestModel):
         raise HTTPException(status_code=400, detail="Invalid blockchain")
 
     try:
-        block = blockchain.mine_block(miner_address)
-        # Convert block dict to BlockModel
-        block_model = BlockModel(
-            index=block["index"],
-            timestamp=block["timestamp"],
-            transactions=[
-                TransactionModel(
-                    sender=tx["sender"],
-                    receiver=tx["receiver"],
-                    nft=NFTModel(**tx["nft"]) if tx.get("nft") else None,
-                    price=tx["price"],
-                    timestamp=tx["timestamp"],
-                )
-                for tx in block["transactions"]
-            ],
-            proof=block["proof"],
-            previous_hash=block["previous_hash"],
-        )
-        # Broadcast the new block to other nodes
-        for node in blockchain.nodes:
-            print(f"Broadcasting block to node: {node}")
-            try:
-                response = requests.post(
-                    f"{node}/api/receive_block",
-                    json=block_model.dict(),
-                    timeout=5,  # 타임아웃 설정 (선택 사항)
-                )
-                if response.status_code != 200:
-                    print(f"Failed to broadcast block to {node}: {response.text}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error broadcasting block to {node}: {e}")
+        block_model = await mine_and_broadcast_block(miner_address)
         # Synchronize the chain after mining
-        blockchain.replace_chain()  # Replace the chain if needed
+        await blockchain.replace_chain(p2p_client)  # Replace the chain if needed
         return MineBlockResponse(
             message="Block mined and broadcasted successfully", block=block_model
         )
+    except MiningCancelled as mc:
+        raise HTTPException(status_code=409, detail=str(mc))
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/mining_stats")
+def get_mining_stats():
+    """
+    Report proof-of-work throughput, e.g. to size miner hosts.
+    """
+    return blockchain.miner.stats()
+
+
+@router.post("/start_mining")
+async def start_mining():
+    """
+    Start the in-process mining scheduler.
+    """
+    started = mining_scheduler.start()
+    return {
+        "message": "Mining scheduler started." if started else "Mining scheduler is already running.",
+        "status": mining_scheduler.status(),
+    }
+
+
+@router.post("/stop_mining")
+async def stop_mining():
+    """
+    Stop the in-process mining scheduler and abandon the current proof-of-work search.
+    """
+    stopped = await mining_scheduler.stop()
+    return {
+        "message": "Mining scheduler stopped." if stopped else "Mining scheduler is not running.",
+        "status": mining_scheduler.status(),
+    }
+
+
+@router.get("/mining_status")
+def get_mining_status():
+    """
+    Report the state of the in-process mining scheduler.
+    """
+    return mining_scheduler.status()
+
+
 @router.get("/blockchain", response_model=BlockchainModel)
-def get_blockchain():
+def get_blockchain(
+    request: Request,
+    from_height: int = Query(1, ge=1, description="Height of the first block to return"),
+    limit: Optional[int] = Query(
+        None,
+        ge=1,
+        description=f"Number of blocks to return, {SYNC_BLOCK_BATCH} at most and by default; all the rest when streaming",
+    ),
+    stream: bool = Query(False, description="Stream the blocks as newline-delimited JSON, exactly as stored"),
+):
     """
-    Retrieve the entire blockchain.
+    Retrieve a page of `limit` blocks starting at `from_height`. Page through the chain
+    by passing the returned `next_height` as the next `from_height`, or stream it to
+    keep memory constant on long chains. Pages carry an ETag and are answered with
+    304 Not Modified if it matches `If-None-Match`.
     """
-    if not blockchain.is_chain_valid():
-        raise HTTPException(status_code=400, detail="Invalid blockchain")
+    if stream:
+        return StreamingResponse(
+            _ndjson_raw_lines(blockchain.iter_block_json(from_height, limit)), media_type=NDJSON_MEDIA_TYPE
+        )
+    limit = _page_limit(limit)
+    chain_length = len(blockchain.chain)
+    last_height = min(from_height - 1 + limit, chain_length)
+    if last_height < from_height:
+        return BlockchainModel(chain=[], length=0)
+    next_height = last_height + 1 if last_height < chain_length else None
+    # The last block's hash commits to every block before it
+    etag = f'"{blockchain.chain.hash_at(last_height - 1)}-{from_height}-{next_height or 0}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    blocks = []
+    for index in range(from_height, last_height + 1):
+        cached = _block_json(index)
+        if cached is None:
+            break  # The chain got shorter meanwhile
+        blocks.append(cached[0])
+    body = b"".join((
+        b'{"chain":[', b",".join(blocks), b'],"length":', str(len(blocks)).encode(),
+        b',"next_height":', json.dumps(next_height).encode(), b"}",
+    ))
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@router.get("/tip")
+def get_tip():
+    """
+    Height and hash of the chain tip, polled by peers to decide whether to sync.
+    """
+    return blockchain.get_tip()
 
-    chain_data = []
-    for block in blockchain.chain:
-        transactions = []
-        for tx in block["transactions"]:
-            if tx["nft"]:
-                nft = NFTModel(**tx["nft"])
-            else:
-                nft = None
-            transaction = TransactionModel(
-                sender=tx["sender"],
-                receiver=tx["receiver"],
-                nft=nft,
-                price=tx["price"],
-                timestamp=tx["timestamp"],
-            )
-            transactions.append(transaction)
-        block_model = BlockModel(
-            index=block["index"],
-            timestamp=block["timestamp"],
-            transactions=transactions,
-            proof=block["proof"],
-            previous_hash=block["previous_hash"],
+
+@router.get("/headers", response_model=List[dict])
+def get_headers(
+    from_height: int = Query(1, ge=1, description="Height of the first header to return"),
+    limit: int = Query(SYNC_HEADER_BATCH, ge=1, le=SYNC_HEADER_BATCH, description="Number of headers to return"),
+):
+    """
+    Retrieve a range of block headers together with their block hashes.
+    """
+    return blockchain.get_headers(from_height, limit)
+
+
+@router.get("/blocks", response_model=List[dict])
+def get_blocks(
+    from_height: int = Query(1, ge=1, description="Height of the first block to return"),
+    limit: int = Query(
+        SYNC_BLOCK_BATCH, ge=1, description=f"Number of blocks to return, at most {SYNC_BLOCK_BATCH} unless streaming"
+    ),
+    stream: bool = Query(False, description="Stream the blocks as newline-delimited JSON"),
+):
+    """
+    Retrieve a range of blocks exactly as stored, for chain sync.
+    """
+    if stream:
+        return StreamingResponse(
+            _ndjson_raw_lines(blockchain.iter_block_json(from_height, limit)), media_type=NDJSON_MEDIA_TYPE
         )
-        chain_data.append(block_model)
-    return BlockchainModel(chain=chain_data, length=len(chain_data))
+    return blockchain.get_blocks(from_height, _page_limit(limit))
+
+
+def _page_limit(limit: Optional[int]) -> int:
+    # Responses that are built in memory are capped; streaming has no such limit
+    if limit is None:
+        return SYNC_BLOCK_BATCH
+    if limit > SYNC_BLOCK_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {SYNC_BLOCK_BATCH} blocks per request, use stream=true for more.",
+        )
+    return limit
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _ndjson_lines(records):
+    # Sync generator, so Starlette serializes each record in a worker thread as the client reads
+    for record in records:
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def _ndjson_raw_lines(payloads):
+    # Stored blocks are already compact JSON, so they are written out without re-serializing
+    for payload in payloads:
+        yield payload + b"\n"
 
 
 @router.get("/validate", response_model=bool)
-def is_blockchain_valid():
+def is_blockchain_valid(
+    full: bool = Query(
+        False, description="Re-hash and re-check every block instead of the validated-height watermark"
+    ),
+):
     """
     Validate the integrity of the blockchain.
     """
-    return blockchain.is_chain_valid()
+    return blockchain.is_chain_valid(full=full)
 
 
 @router.get("/previous_block", response_model=BlockModel)
-def get_previous_block():
+def get_previous_block(request: Request):
     """
     Get the most recent block in the blockchain.
     """
-    if not blockchain.is_chain_valid():
-        raise HTTPException(status_code=400, detail="Invalid blockchain")
-
-    previous_block = blockchain.get_previous_block()
-    transactions = []
-    for tx in previous_block["transactions"]:
-        if tx["nft"]:
-            nft = NFTModel(**tx["nft"])
-        else:
-            nft = None
-        transaction = TransactionModel(
-            sender=tx["sender"],
-            receiver=tx["receiver"],
-            nft=nft,
-            price=tx["price"],
-            timestamp=tx["timestamp"],
-        )
-        transactions.append(transaction)
-
-    block_model = BlockModel(
-        index=previous_block["index"],
-        timestamp=previous_block["timestamp"],
-        transactions=transactions,
-        proof=previous_block["proof"],
-        previous_hash=previous_block["previous_hash"],
-    )
-    return block_model
+    return _block_response(request, len(blockchain.chain))
 
 
 @router.get("/nfts", response_model=List[dict])
@@ -362,17 +513,10 @@ def get_all_nfts_with_posts(session=Depends(get_session)):
     Retrieve all unique NFTs in the blockchain along with their current owners, prices,
     and associated post data from the database.
     """
-    unique_nfts = {}
     nfts_with_details = []
 
-    # Step 1: Collect all unique NFTs by their DNA
-    for block in blockchain.chain:
-        for tx in block["transactions"]:
-            nft_data = tx.get("nft")
-            if nft_data:
-                dna = nft_data.get("dna")
-                if dna and dna not in unique_nfts:
-                    unique_nfts[dna] = NFTModel(**nft_data)
+    # Step 1: Collect all unique NFTs by their DNA from the world state
+    unique_nfts = dict(blockchain.nft_state.items())
 
     # Step 2: Query all matching posts in a single database query
     nft_dnas = list(unique_nfts.keys())
@@ -397,29 +541,16 @@ def get_all_nfts_with_posts(session=Depends(get_session)):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
     # Step 3: Add owner, price, and post information
-    for dna, nft in unique_nfts.items():
-        owner = get_current_owner(dna)
-        current_price = None
-
-        # Find the latest transaction with a price
-        for block in reversed(blockchain.chain):
-            for tx in reversed(block["transactions"]):
-                if tx.get("nft") and tx["nft"].get("dna") == dna:
-                    if tx.get("price") is not None:
-                        current_price = tx["price"]
-                        break
-            if current_price is not None:
-                break
-
+    for dna, state in unique_nfts.items():
         # Fetch the corresponding post (if exists)
         post = posts.get(dna)
 
         # Append the NFT details along with the post information
         nfts_with_details.append(
             {
-                "nft": nft.dict(),
-                "owner": owner,
-                "price": current_price,
+                "nft": NFTModel(**state["nft"]).dict(),
+                "owner": state["owner"],
+                "price": state["price"],
                 "post": post,  # Include the post data (or None if no match found)
             }
         )
@@ -432,27 +563,13 @@ def get_nft_by_dna(dna: str):
     """
     Retrieve a specific NFT by its DNA along with the current owner.
     """
-    print(f"Searching for DNA: {dna}")
-    nft_found = None
-    owner = None
-    last_block_index = None
-
-    # Iterate over the blockchain in chronological order
-    for block in blockchain.chain:
-        print(f"Inspecting block: {block['index']}")
-        for tx in block["transactions"]:
-            nft_data = tx.get("nft")
-            if nft_data:
-                print(f"Found NFT with DNA: {nft_data.get('dna')}")
-            if nft_data and nft_data.get("dna") == dna:
-                nft_found = NFTModel(**nft_data)
-                owner = tx["receiver"]  # The receiver is the current owner
-                last_block_index = block["index"]
-
-    if nft_found and owner:
-        print(f"NFT found: {nft_found}")
+    state = blockchain.nft_state.get(dna)
+
+    if state and state["owner"]:
         return NFTDetailModel(
-            nft=nft_found, owner=owner, last_block_index=last_block_index
+            nft=NFTModel(**state["nft"]),
+            owner=state["owner"],
+            last_block_index=state["last_block_index"],
         )
 
     print("NFT not found")
@@ -460,13 +577,34 @@ def get_nft_by_dna(dna: str):
 
 
 @router.get("/transactions", response_model=List[TransactionModel])
-def get_confirmed_transactions():
+def get_confirmed_transactions(
+    response: Response,
+    from_height: int = Query(1, ge=1, description="Height of the first block to read transactions from"),
+    limit: Optional[int] = Query(
+        None,
+        ge=1,
+        description=f"Number of blocks to read, {SYNC_BLOCK_BATCH} at most and by default; all the rest when streaming",
+    ),
+    stream: bool = Query(False, description="Stream the transactions as newline-delimited JSON"),
+):
     """
-    Retrieve all confirmed transactions that are included in the blockchain.
+    Retrieve the confirmed transactions of the `limit` blocks starting at `from_height`.
+    The `X-Next-Height` header holds the `from_height` of the next page, and is missing
+    on the last one.
     """
+    if stream:
+        return StreamingResponse(
+            _ndjson_lines(
+                tx for block in blockchain.iter_blocks(from_height, limit) for tx in block["transactions"]
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    limit = _page_limit(limit)
     transactions = []
     try:
-        for block in blockchain.chain:
+        blocks_read = 0
+        for block in blockchain.iter_blocks(from_height, limit):
+            blocks_read += 1
             for tx in block["transactions"]:
                 transaction = TransactionModel(
                     sender=tx["sender"],
@@ -476,6 +614,8 @@ def get_confirmed_transactions():
                     timestamp=tx["timestamp"],
                 )
                 transactions.append(transaction)
+        if from_height + blocks_read <= len(blockchain.chain):
+            response.headers["X-Next-Height"] = str(from_height + blocks_read)
         return transactions
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -505,63 +645,150 @@ def get_pending_transactions():
 # New block retrieval endpoint
 @router.get("/block", response_model=BlockModel)
 def get_block(
+    request: Request,
     index: Optional[int] = Query(None, description="Index of the block to retrieve"),
     hash: Optional[str] = Query(None, description="Hash of the block to retrieve"),
 ):
     """
-    Retrieve a specific block by its index or hash.
+    Retrieve a specific block by its index or hash. The block hash is its ETag.
     """
     if index is None and hash is None:
         raise HTTPException(
             status_code=400, detail="Either 'index' or 'hash' must be provided."
         )
 
-    block = None
-
-    if index is not None:
-        block = blockchain.get_block_by_index(index)
-        if not block:
-            raise HTTPException(
-                status_code=404, detail=f"Block with index {index} not found."
-            )
-    elif hash is not None:
+    if index is None:
+        index = blockchain.height_of(hash)
+    if index is None:
+        # Not on the main chain, but peers may still ask for a side chain block we relayed
         block = blockchain.get_block_by_hash(hash)
         if not block:
             raise HTTPException(
                 status_code=404, detail=f"Block with hash {hash} not found."
             )
+        return _json_response(request, f'"{hash}"', BlockModel(**block).model_dump_json().encode())
+    response = _block_response(request, index)
+    if response is None:
+        raise HTTPException(
+            status_code=404, detail=f"Block with index {index} not found."
+        )
+    return response
 
-    # Convert block dict to BlockModel
-    transactions = []
-    for tx in block["transactions"]:
-        if tx["nft"]:
-            nft = NFTModel(**tx["nft"])
-        else:
-            nft = None
-        transaction = TransactionModel(
-            sender=tx["sender"],
-            receiver=tx["receiver"],
-            nft=nft,
-            price=tx["price"],
-            timestamp=tx["timestamp"],
+
+def _block_json(index: int):
+    """
+    Serialized BlockModel of the block at `index` and the block's hash, or None.
+    Served from the block response cache, so a hot block is never rebuilt.
+    """
+    if not 1 <= index <= len(blockchain.chain):
+        return None
+    try:
+        block_hash = blockchain.chain.hash_at(index - 1)
+    except IndexError:
+        return None  # The chain got shorter meanwhile
+    body = block_cache.get(block_hash)
+    if body is None:
+        found = blockchain.get_block_and_hash(index)
+        if found is None:
+            return None
+        block, block_hash = found
+        body = BlockModel(**block).model_dump_json().encode()
+        block_cache.put(block_hash, body)
+    return body, block_hash
+
+
+def _block_response(request: Request, index: int) -> Optional[Response]:
+    cached = _block_json(index)
+    if cached is None:
+        return None
+    body, block_hash = cached
+    return _json_response(request, f'"{block_hash}"', body)
+
+
+def _json_response(request: Request, etag: str, body: bytes) -> Response:
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+@router.get("/block_transactions", response_model=List[dict])
+def get_block_transactions(
+    hash: str = Query(..., description="Hash of the block"),
+    positions: List[int] = Query(..., description="Positions of the transactions in the block"),
+):
+    """
+    Retrieve selected transactions of a block, for peers rebuilding a compact block.
+    """
+    block = blockchain.get_block_by_hash(hash)
+    if not block:
+        raise HTTPException(status_code=404, detail=f"Block with hash {hash} not found.")
+    transactions = block["transactions"]
+    if any(not 0 <= position < len(transactions) for position in positions):
+        raise HTTPException(status_code=400, detail="Transaction position out of range.")
+    return [transactions[position] for position in positions]
+
+
+@router.get("/transaction_proof")
+def get_transaction_proof(
+    dna: Optional[str] = Query(None, description="DNA of the NFT whose latest transfer to prove"),
+    tx_id: Optional[str] = Query(None, description="Id of the transaction to prove"),
+    index: Optional[int] = Query(None, description="Index of the block holding the transaction (with tx_id)"),
+):
+    """
+    Return a Merkle inclusion proof for a transaction: the block header, the
+    transaction and the sibling hashes leading to the header's Merkle root.
+    """
+    if dna is not None:
+        state = blockchain.nft_state.get(dna)
+        if not state:
+            raise HTTPException(status_code=404, detail="NFT not found")
+        block = blockchain.get_block_by_index(state["last_block_index"])
+        positions = [
+            position
+            for position, tx in enumerate(block["transactions"])
+            if tx.get("nft") and tx["nft"].get("dna") == dna
+        ]
+        position = positions[-1]
+    elif tx_id is not None and index is not None:
+        block = blockchain.get_block_by_index(index)
+        if not block:
+            raise HTTPException(status_code=404, detail=f"Block with index {index} not found.")
+        positions = [
+            position
+            for position, tx in enumerate(block["transactions"])
+            if transaction_id(tx) == tx_id
+        ]
+        if not positions:
+            raise HTTPException(
+                status_code=404, detail=f"Transaction {tx_id} not found in block {index}."
+            )
+        position = positions[0]
+    else:
+        raise HTTPException(
+            status_code=400, detail="Either 'dna' or both 'tx_id' and 'index' must be provided."
         )
-        transactions.append(transaction)
 
-    block_model = BlockModel(
-        index=block["index"],
-        timestamp=block["timestamp"],
-        transactions=transactions,
-        proof=block["proof"],
-        previous_hash=block["previous_hash"],
-    )
-    return block_model
+    if not block.get("merkle_root"):
+        raise HTTPException(
+            status_code=409, detail=f"Block {block['index']} predates Merkle roots."
+        )
+    return blockchain.get_inclusion_proof(block, position)
 
 
 # Node registration endpoint
 @router.post(
     "/register_node",
 )
-def register_node(node: NodeRegisterModel):
+async def register_node(node: NodeRegisterModel):
     """
     Register a new node in the network and propagate it to all existing nodes.
     """
@@ -571,10 +798,7 @@ def register_node(node: NodeRegisterModel):
         raise HTTPException(status_code=400, detail="Invalid node address")
 
     # Prevent registering the current node
-    current_host = os.getenv("HOST", "localhost")
-    current_port = os.getenv("PORT", "8000")
-    current_node = f"http://{current_host}:{current_port}"
-    if node_address == current_node:
+    if node_address == NODE_ADDRESS:
         raise HTTPException(status_code=400, detail="Cannot register the current node.")
 
     # Register the node (idempotent operation)
@@ -592,22 +816,9 @@ def register_node(node: NodeRegisterModel):
         "total_nodes": list(blockchain.nodes),
     }
 
-    # Broadcast the new node to all existing nodes except itself
-    for existing_node in blockchain.nodes:
-        if existing_node != node_address and existing_node != current_node:
-            try:
-                print(f"Broadcasting new node to {existing_node}")
-                response_broadcast = requests.post(
-                    f"{existing_node}/api/register_node",
-                    json={"node_address": node_address},
-                    timeout=5,  # 타임아웃 설정 (선택 사항)
-                )
-                if response_broadcast.status_code != 200:
-                    print(
-                        f"Failed to broadcast to {existing_node}: {response_broadcast.text}"
-                    )
-            except requests.exceptions.RequestException as e:
-                print(f"Failed to broadcast to {existing_node}: {e}")
+    # Announce the new node to the network; known nodes are not announced again
+    if not already_exists:
+        await gossip.publish("node", {"node_address": node_address}, exclude=[node_address])
 
     return response
 
@@ -623,20 +834,20 @@ def get_nodes():
 
 # Chain replacement endpoint
 @router.get("/replace_chain")
-def replace_chain():
+async def replace_chain():
     """
     Compare and replace the chain with the longest one in the network.
     """
-    is_replaced = blockchain.replace_chain()
+    is_replaced = await blockchain.replace_chain(p2p_client)
     if is_replaced:
         response = {
             "message": "The chain was replaced by the longest one.",
-            "new_chain": blockchain.chain,
+            "new_chain": list(blockchain.chain),
         }
     else:
         response = {
             "message": "Current chain is already the longest.",
-            "chain": blockchain.chain,
+            "chain": list(blockchain.chain),
         }
     return response
 
@@ -645,26 +856,20 @@ def replace_chain():
 @router.post(
     "/broadcast_block",
 )
-def broadcast_block(block: BlockModel):
+async def broadcast_block(block: BlockModel):
     """
     Broadcast a new block to other nodes in the network.
     """
     # Validate and add the block to the chain before broadcasting
-    added = blockchain.add_block(block.dict())
+    added = await run_in_threadpool(blockchain.add_block, block.dict())
     if not added:
         raise HTTPException(status_code=400, detail="Invalid block")
-    # Send the block to other nodes
-    for node in blockchain.nodes:
-        try:
-            response = requests.post(
-                f"{node}/api/receive_block",
-                json=block.dict(),
-                timeout=5,  # 타임아웃 설정 (선택 사항)
-            )
-            if response.status_code != 200:
-                print(f"Failed to broadcast block to {node}: {response.text}")
-        except requests.exceptions.RequestException:
-            continue
+    # Gossip the block to the network, in compact form unless it predates Merkle roots
+    block_data = block.dict()
+    if block_data.get("merkle_root"):
+        await gossip.publish("compact_block", blockchain.compact_block(block_data))
+    else:
+        await gossip.publish("block", block_data)
     return {"message": "Block broadcasted successfully."}
 
 
@@ -672,16 +877,18 @@ def broadcast_block(block: BlockModel):
 @router.post(
     "/receive_block",
 )
-def receive_block(block: BlockModel):
+async def receive_block(block: BlockModel):
     """
     Receive a block from another node and add it to the chain.
     """
     try:
         block_data = block.dict()
-        added = blockchain.add_block(block_data)
+        added = await run_in_threadpool(blockchain.add_block, block_data)
+        if not added and blockchain.is_orphan(block_data):
+            return {"message": "Block is held as an orphan until its parent arrives."}
         if not added:
             # If the block was not added, check if the received chain is longer
-            replaced = blockchain.replace_chain()
+            replaced = await blockchain.replace_chain(p2p_client)
             if replaced:
                 return {
                     "message": "Chain was replaced with the longest one after receiving block."
@@ -691,7 +898,130 @@ def receive_block(block: BlockModel):
                     status_code=400, detail="Invalid block and chain not replaced."
                 )
         return {"message": "Block added successfully."}
+    except HTTPException:
+        raise
     except KeyError as ke:
         raise HTTPException(status_code=400, detail=f"Missing key in block data: {ke}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# Gossip endpoints
+@router.post("/gossip")
+async def receive_gossip(message: GossipMessageModel):
+    """
+    Receive a gossiped block, transaction or node announcement from a peer,
+    apply it and relay it onwards if it is new and valid.
+    """
+    try:
+        result = await gossip.receive(message.dict())
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": result}
+
+
+@router.post("/receive_transactions")
+async def receive_transactions(batch: GossipBatchModel):
+    """
+    Receive a batch of gossiped transactions from a peer. Each one is admitted
+    and relayed onwards like a single gossiped transaction.
+    """
+    results = {"accepted": 0, "rejected": 0, "duplicate": 0}
+    for message in batch.messages:
+        if message.type != "transaction":
+            raise HTTPException(status_code=400, detail=f"Unexpected message type '{message.type}' in batch.")
+        results[await gossip.receive(message.dict())] += 1
+    return results
+
+
+@router.get("/gossip_stats")
+def get_gossip_stats():
+    """
+    Report how many gossip messages this node published, received, dropped as
+    duplicates and relayed, and how transaction batches are doing.
+    """
+    return {
+        **gossip.stats,
+        "peers": len(blockchain.nodes),
+        "fanout": gossip.fanout,
+        "ttl": gossip.ttl,
+        "tx_relay": {**tx_relay.stats, "pending": tx_relay.pending()},
+    }
+
+
+async def _on_gossiped_transaction(payload: dict, sender: Optional[str]) -> bool:
+    try:
+        await run_in_threadpool(create_transaction, TransactionModel(**payload))
+    except HTTPException:
+        return False  # Invalid, conflicting or already pending
+    return True
+
+
+async def _on_gossiped_block(payload: dict, sender: Optional[str]) -> bool:
+    return await _accept_gossiped_block(BlockModel(**payload).dict(), sender)
+
+
+async def _on_gossiped_compact_block(payload: dict, sender: Optional[str]) -> bool:
+    index = payload["header"]["index"]
+    tip_index = blockchain.get_previous_block()["index"]
+    if sender is None:
+        return False
+    if index > tip_index + ORPHAN_FETCH_DEPTH:
+        request_chain_sync()  # Too far ahead to fetch the missing blocks one by one
+        return False
+    try:
+        block_data = await blockchain.rebuild_compact_block(p2p_client, payload, sender)
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        print(f"Failed to rebuild compact block {index} from {sender}: {e}, fetching it in full.")
+        try:
+            block_data = await p2p_client.get_json(
+                sender, '/api/block', timeout=SYNC_TIMEOUT, hash=block_hash(payload["header"])
+            )
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Failed to fetch block {index} from {sender}: {e}")
+            request_chain_sync()
+            return False
+    if block_data is None:
+        return False
+    return await _accept_gossiped_block(block_data, sender)
+
+
+async def _accept_gossiped_block(block_data: dict, sender: Optional[str]) -> bool:
+    """
+    Add a gossiped block, fetching only its missing ancestors from the sender if it
+    is an orphan. Falls back to a chain sync if it still does not connect.
+    """
+    try:
+        if await blockchain.accept_block(p2p_client, block_data, sender):
+            return True
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        print(f"Failed to fetch the ancestors of block {block_data['index']} from {sender}: {e}")
+    # The block does not extend our chain, so we may be far behind or on another branch
+    if block_data["index"] > blockchain.get_previous_block()["index"]:
+        request_chain_sync()
+    return False
+
+
+async def _on_gossiped_node(payload: dict, sender: Optional[str]) -> bool:
+    node_address = payload["node_address"]
+    if node_address == NODE_ADDRESS or node_address in blockchain.nodes:
+        return False
+    blockchain.register_node(node_address)
+    return True
+
+
+gossip.register("transaction", _on_gossiped_transaction)
+gossip.register("block", _on_gossiped_block)
+gossip.register("compact_block", _on_gossiped_compact_block)
+gossip.register("node", _on_gossiped_node)
+
+_sync_task: Optional[asyncio.Task] = None
+
+
+def request_chain_sync() -> None:
+    """
+    Start a chain sync in the background unless one is already running.
+    """
+    global _sync_task
+    if _sync_task is None or _sync_task.done():
+        _sync_task = asyncio.ensure_future(blockchain.replace_chain(p2p_client))
@@ -0,0 +1,48 @@
+# block_cache.py
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class BlockResponseCache:
+    """
+    LRU cache of serialized block responses, keyed by block hash.
+
+    A block never changes once it has a hash, so its JSON only has to be built once
+    and can be served as is afterwards. Entries are evicted least recently used first
+    once their total size exceeds `max_bytes`. Safe to use from several threads.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, block_hash: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(block_hash)
+            if body is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(block_hash)
+            self.stats["hits"] += 1
+            return body
+
+    def put(self, block_hash: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        with self._lock:
+            previous = self._entries.pop(block_hash, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[block_hash] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats["evictions"] += 1
@@ -0,0 +1,141 @@
+# gossip.py
+import asyncio
+import hashlib as _hashlib
+import json as _json
+import random as _random
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from utils.p2p_client import P2PClient
+from utils.tx_relay import TransactionRelay
+
+# A handler applies a gossiped payload locally, given the peer it came from, and
+# returns True if it was new and valid, in which case the message is passed on
+GossipHandler = Callable[[dict, Optional[str]], Awaitable[bool]]
+
+
+def message_id(kind: str, payload: dict) -> str:
+    """
+    Content hash of a gossip message, the same on every node that relays it.
+    """
+    encoded = _json.dumps({"type": kind, "payload": payload}, sort_keys=True, separators=(",", ":"))
+    return _hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class Gossip:
+    """
+    Epidemic relay of blocks, transactions and peer announcements.
+
+    Instead of pushing every message to every peer, a node sends it to `fanout`
+    randomly chosen peers, which relay it the same way until its hop `ttl` runs out.
+    Each node remembers the ids of the last `seen_capacity` messages and drops
+    repeats, so a message is handled and relayed at most once per node and per-node
+    traffic stays roughly constant as the network grows.
+
+    Transactions are frequent and small, so when a `tx_relay` is given they are
+    queued per peer and sent in batches instead of one request each.
+    """
+
+    def __init__(
+        self,
+        client: P2PClient,
+        peers: Callable[[], Iterable[str]],
+        node_address: str,
+        fanout: int = 4,
+        ttl: int = 6,
+        seen_capacity: int = 100_000,
+        tx_relay: Optional[TransactionRelay] = None,
+    ) -> None:
+        self.client = client
+        self.tx_relay = tx_relay
+        self.peers = peers
+        self.node_address = node_address
+        self.fanout = fanout
+        self.ttl = ttl
+        self.seen_capacity = seen_capacity
+        self._handlers: Dict[str, GossipHandler] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._relays: set = set()  # Keeps relay tasks alive until they finish
+        self.stats = {"published": 0, "received": 0, "duplicates": 0, "relayed": 0}
+
+    def register(self, kind: str, handler: GossipHandler) -> None:
+        self._handlers[kind] = handler
+
+    def mark_seen(self, msg_id: str) -> bool:
+        """
+        Record a message id. Returns False if it had already been seen.
+        """
+        if msg_id in self._seen:
+            self._seen.move_to_end(msg_id)
+            return False
+        self._seen[msg_id] = None
+        if len(self._seen) > self.seen_capacity:
+            self._seen.popitem(last=False)
+        return True
+
+    async def publish(self, kind: str, payload: dict, exclude: Iterable[str] = ()) -> Dict[str, str]:
+        """
+        Start gossiping a message that originates here and has already been applied
+        locally, skipping the peers in `exclude`. Returns an error message for each
+        peer it could not be sent to.
+        """
+        msg_id = message_id(kind, payload)
+        self.mark_seen(msg_id)
+        self.stats["published"] += 1
+        message = {
+            "id": msg_id,
+            "type": kind,
+            "payload": payload,
+            "ttl": self.ttl,
+            "origin": self.node_address,
+            "sender": self.node_address,
+        }
+        return await self._send(message, exclude=exclude)
+
+    async def receive(self, message: dict) -> str:
+        """
+        Handle a message from a peer and relay it if it was new and valid.
+        Returns "duplicate", "rejected" or "accepted".
+        """
+        kind = message["type"]
+        handler = self._handlers.get(kind)
+        if handler is None:
+            raise ValueError(f"Unknown gossip message type '{kind}'.")
+        # The id is recomputed so a peer cannot smuggle a payload past the seen-cache
+        msg_id = message_id(kind, message["payload"])
+        if not self.mark_seen(msg_id):
+            self.stats["duplicates"] += 1
+            return "duplicate"
+        self.stats["received"] += 1
+
+        if not await handler(message["payload"], message.get("sender")):
+            return "rejected"
+        if message["ttl"] > 1:
+            relayed = {
+                **message,
+                "id": msg_id,
+                "ttl": message["ttl"] - 1,
+                "sender": self.node_address,
+            }
+            exclude = (message.get("sender"), message.get("origin"))
+            task = asyncio.ensure_future(self._send(relayed, exclude=exclude))
+            self._relays.add(task)
+            task.add_done_callback(self._relays.discard)
+            self.stats["relayed"] += 1
+        return "accepted"
+
+    def _pick_targets(self, exclude: Iterable[Optional[str]]) -> List[str]:
+        excluded = set(exclude) | {self.node_address}
+        candidates = [peer for peer in self.peers() if peer not in excluded]
+        return _random.sample(candidates, min(self.fanout, len(candidates)))
+
+    async def _send(self, message: dict, exclude: Iterable[Optional[str]]) -> Dict[str, str]:
+        targets = self._pick_targets(exclude)
+        if message["type"] == "transaction" and self.tx_relay is not None:
+            for target in targets:
+                self.tx_relay.enqueue(target, message)
+            return {}
+        errors = await self.client.broadcast(targets, "/api/gossip", message, timeout=5)
+        for node, error in errors.items():
+            print(f"Failed to gossip {message['type']} to {node}: {error}")
+        return errors
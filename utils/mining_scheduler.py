@@ -0,0 +1,130 @@
+# mining_scheduler.py
+import asyncio
+import time as _time
+from typing import Awaitable, Callable, Optional
+
+from models.blockchain import Blockchain
+from models.blockchain_util import BlockModel
+
+
+class MiningScheduler:
+    """
+    Mines blocks inside the app process.
+
+    A block is mined as soon as the mempool holds `min_transactions`, or once the
+    oldest pending transaction has waited `max_latency` seconds, so confirmation
+    latency follows load instead of a fixed timer. `mine` is a coroutine that must run
+    proof of work in a worker thread (which fans out to the miner's process pool),
+    never on the event loop.
+    """
+
+    def __init__(
+        self,
+        blockchain: Blockchain,
+        mine: Callable[[], Awaitable[BlockModel]],
+        min_transactions: int = 100,
+        max_latency: float = 60.0,
+    ) -> None:
+        self.blockchain = blockchain
+        self.mine = mine
+        self.min_transactions = min_transactions
+        self.max_latency = max_latency
+        self.blocks_mined = 0
+        self.last_block_index: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self._mining = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> bool:
+        """
+        Start the scheduler on the running event loop. Returns False if already running.
+        """
+        if self.running:
+            return False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+        print("Mining scheduler started.")
+        return True
+
+    async def stop(self) -> bool:
+        """
+        Stop the scheduler and abandon any proof-of-work search in progress.
+        Returns False if it was not running.
+        """
+        if not self.running:
+            return False
+        self._task.cancel()
+        self.blockchain.miner.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        print("Mining scheduler stopped.")
+        return True
+
+    def notify(self) -> None:
+        """
+        Signal that the mempool changed. Safe to call from any thread.
+        """
+        if self._loop is not None and self._wakeup is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def status(self) -> dict:
+        pending = len(self.blockchain.mempool)
+        oldest = self.blockchain.mempool.oldest_added_at()
+        waited = _time.time() - oldest if oldest else 0.0
+        return {
+            "running": self.running,
+            "mining": self._mining,
+            "pending_transactions": pending,
+            "oldest_pending_wait_seconds": round(waited, 2),
+            "min_transactions": self.min_transactions,
+            "max_latency_seconds": self.max_latency,
+            "blocks_mined": self.blocks_mined,
+            "last_block_index": self.last_block_index,
+            "last_error": self.last_error,
+        }
+
+    def _seconds_until_due(self) -> Optional[float]:
+        """
+        Return 0 if a block should be mined now, the seconds left until the latency
+        target is hit otherwise, or None if the mempool is empty.
+        """
+        oldest = self.blockchain.mempool.oldest_added_at()
+        if oldest is None:
+            return None
+        if len(self.blockchain.mempool) >= self.min_transactions:
+            return 0.0
+        return max(0.0, oldest + self.max_latency - _time.time())
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = self._seconds_until_due()
+            if delay != 0.0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._mining = True
+            try:
+                block = await self.mine()
+                self.blocks_mined += 1
+                self.last_block_index = block.index
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Scheduled mining failed: {e}")
+                await asyncio.sleep(1)  # Avoid spinning if mining keeps failing
+            finally:
+                self._mining = False
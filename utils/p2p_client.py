@@ -0,0 +1,122 @@
+# p2p_client.py
+import asyncio
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+
+class P2PClient:
+    """
+    Shared async HTTP client for talking to peer nodes.
+
+    One connection pool serves all outbound P2P traffic, so connections to a peer are
+    kept alive and reused instead of paying a handshake per request. Every request is
+    bounded by a timeout, and fan-outs to many peers run in parallel with at most
+    `max_concurrency` requests in flight across all of them. The app starts the client on startup and
+    closes it on shutdown.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_connections: int = 100,
+        max_concurrency: int = 32,
+    ) -> None:
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def start(self) -> None:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        self.start()  # No-op once started, covers use outside the app lifecycle
+        return self._client
+
+    async def get_json(self, node: str, path: str, timeout: Optional[float] = None, **params):
+        """
+        GET `path` from `node` and return the decoded JSON body.
+        Raises httpx.HTTPError on connection errors, timeouts and error statuses.
+        """
+        response = await self.client.get(
+            f"{node}{path}", params=params or None, timeout=timeout or self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def stream_json_lines(
+        self, node: str, path: str, timeout: Optional[float] = None, **params
+    ) -> AsyncIterator:
+        """
+        GET `path` from `node` as newline-delimited JSON and yield each record as soon
+        as its line arrives. `timeout` bounds every read, not the whole download.
+        Raises httpx.HTTPError on connection errors, timeouts and error statuses.
+        """
+        async with self.client.stream(
+            "GET", f"{node}{path}", params=params or None, timeout=timeout or self.timeout
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    async def post_json(
+        self, node: str, path: str, payload, timeout: Optional[float] = None
+    ) -> httpx.Response:
+        return await self.client.post(f"{node}{path}", json=payload, timeout=timeout or self.timeout)
+
+    async def fan_out(
+        self, nodes: Iterable[str], call: Callable[[str], Awaitable[T]]
+    ) -> Dict[str, object]:
+        """
+        Run `call(node)` for every node in parallel, with at most `max_concurrency`
+        calls in flight. Returns each node's result, or the exception it raised.
+        """
+        self.start()
+        semaphore = self._semaphore
+
+        async def limited(node: str):
+            async with semaphore:
+                return await call(node)
+
+        nodes = list(nodes)
+        results = await asyncio.gather(*(limited(node) for node in nodes), return_exceptions=True)
+        return dict(zip(nodes, results))
+
+    async def broadcast(
+        self, nodes: Iterable[str], path: str, payload, timeout: Optional[float] = None
+    ) -> Dict[str, str]:
+        """
+        POST `payload` to `path` on every node in parallel.
+        Returns an error message for each node that failed; an empty dict means success.
+        """
+        results = await self.fan_out(
+            nodes, lambda node: self.post_json(node, path, payload, timeout=timeout)
+        )
+        errors = {}
+        for node, result in results.items():
+            if isinstance(result, Exception):
+                errors[node] = str(result) or type(result).__name__
+            elif result.status_code != 200:
+                errors[node] = result.text
+        return errors
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
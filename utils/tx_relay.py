@@ -0,0 +1,85 @@
+# tx_relay.py
+import asyncio
+from typing import Dict, List, Optional
+
+from utils.p2p_client import P2PClient
+
+
+class TransactionRelay:
+    """
+    Per-peer outbound queues for gossiped transactions.
+
+    Instead of one request per transaction and peer, messages for a peer are queued
+    and sent as one batch to the peer's bulk endpoint, as soon as `batch_size` are
+    queued or `flush_interval` seconds after the first one was. Queuing never waits
+    on the network, so relaying costs a client request nothing. A peer that falls
+    `max_queue` messages behind loses its oldest queued messages.
+    """
+
+    def __init__(
+        self,
+        client: P2PClient,
+        path: str = "/api/receive_transactions",
+        batch_size: int = 256,
+        flush_interval: float = 0.1,
+        max_queue: int = 10_000,
+    ) -> None:
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queues: Dict[str, List[dict]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flushes: set = set()  # Keeps flush tasks alive until they finish
+        self.stats = {"queued": 0, "dropped": 0, "batches": 0, "sent": 0, "failed": 0}
+
+    def enqueue(self, node: str, message: dict) -> None:
+        """
+        Queue a message for `node`. Must be called on the event loop.
+        """
+        queue = self._queues.setdefault(node, [])
+        if len(queue) >= self.max_queue:
+            queue.pop(0)
+            self.stats["dropped"] += 1
+        queue.append(message)
+        self.stats["queued"] += 1
+        if len(queue) >= self.batch_size:
+            self._start_flush(node)
+        elif node not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[node] = loop.call_later(self.flush_interval, self._start_flush, node)
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def close(self) -> None:
+        """
+        Send everything still queued and wait for batches in flight.
+        """
+        for node in list(self._queues):
+            self._start_flush(node)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _start_flush(self, node: str) -> None:
+        timer: Optional[asyncio.TimerHandle] = self._timers.pop(node, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._queues.pop(node, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(node, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _send(self, node: str, batch: List[dict]) -> None:
+        self.stats["batches"] += 1
+        try:
+            response = await self.client.post_json(node, self.path, {"messages": batch})
+            if response.status_code != 200:
+                raise RuntimeError(response.text)
+            self.stats["sent"] += len(batch)
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            print(f"Failed to relay {len(batch)} transactions to {node}: {e}")